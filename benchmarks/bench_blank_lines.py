@@ -0,0 +1,31 @@
+"""Time LkmlFormatter.fmt on files with many siblings and blank lines.
+
+python -m benchmarks.bench_blank_lines
+"""
+
+import time
+
+from lkmlfmt.formatter import LkmlFormatter
+
+LINES = [1_000, 10_000, 30_000, 100_000]
+
+
+def generate(n_lines: int) -> str:
+    lines = []
+    for i in range(n_lines):
+        lines.append("" if i % 3 == 2 else f"key_{i}: value_{i}")
+    return "\n".join(lines) + "\n"
+
+
+def main() -> None:
+    print(f"{'lines':>8} {'seconds':>8} {'us/line':>8}")
+    for n in LINES:
+        lkml = generate(n)
+        start = time.perf_counter()
+        LkmlFormatter(lkml, clickhouse=False, plugins=[]).fmt()
+        elapsed = time.perf_counter() - start
+        print(f"{n:>8} {elapsed:>8.3f} {elapsed / n * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Measure the latency of formatting a file with and without the daemon.
+
+python -m benchmarks.bench_daemon
+"""
+
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPEAT = 20
+LKML = """\
+view: orders {
+  sql_table_name: analytics.orders ;;
+  dimension: id {
+    sql: ${TABLE}.id ;;
+  }
+  derived_table: {
+    sql: select id, sum(amount) as amount from orders group by id ;;
+  }
+}
+"""
+
+
+def measure(cmd: list[str], file: Path) -> float:
+    file.write_text(LKML)
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        file = Path(directory) / "orders.view.lkml"
+        socket = Path(directory) / "lkmlfmt.sock"
+        lkmlfmt = [sys.executable, "-m", "lkmlfmt"]
+        commands = {
+            "in-process": [*lkmlfmt, "--no-cache", str(file)],
+            "--use-daemon": [
+                *lkmlfmt,
+                *["--no-cache", "--use-daemon", "--socket", str(socket), str(file)],
+            ],
+        }
+
+        daemon = subprocess.Popen(
+            [*lkmlfmt, "daemon", "--socket", str(socket)], stdout=subprocess.PIPE
+        )
+        try:
+            assert daemon.stdout is not None
+            daemon.stdout.readline()  # wait until the daemon is ready
+            for name, cmd in commands.items():
+                measure(cmd, file)  # warm up
+                median = statistics.median(measure(cmd, file) for _ in range(REPEAT))
+                print(f"{name:<16} {median * 1000:>8.1f} ms")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+if __name__ == "__main__":
+    main()
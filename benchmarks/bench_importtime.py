@@ -0,0 +1,35 @@
+"""Measure the cumulative import time reported by `python -X importtime`.
+
+python -m benchmarks.bench_importtime
+"""
+
+import statistics
+import subprocess
+import sys
+
+REPEAT = 10
+MODULES = ["lkmlfmt", "lkmlfmt.command"]
+
+
+def importtime(module: str) -> int:
+    """Return the cumulative import time of the module in microseconds."""
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    # the last line is the module itself
+    # import time: self [us] | cumulative | imported package
+    last = res.stderr.splitlines()[-1]
+    return int(last.split("|")[1])
+
+
+def main() -> None:
+    for module in MODULES:
+        median = statistics.median(importtime(module) for _ in range(REPEAT))
+        print(f"{module:<16} {median / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
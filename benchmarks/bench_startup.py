@@ -0,0 +1,32 @@
+"""Measure the startup time of lkmlfmt.
+
+python -m benchmarks.bench_startup
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+REPEAT = 20
+COMMANDS = {
+    "import lkmlfmt": [sys.executable, "-c", "import lkmlfmt"],
+    "lkmlfmt --help": [sys.executable, "-m", "lkmlfmt", "--help"],
+}
+
+
+def measure(cmd: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    for name, cmd in COMMANDS.items():
+        measure(cmd)  # warm up
+        median = statistics.median(measure(cmd) for _ in range(REPEAT))
+        print(f"{name:<16} {median * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
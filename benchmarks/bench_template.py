@@ -0,0 +1,40 @@
+"""Time template.to_jinja and template.to_liquid on Liquid-heavy SQL.
+
+python -m benchmarks.bench_template
+"""
+
+import time
+
+from lkmlfmt import template
+
+TEMPLATES = [1_000, 10_000]
+
+
+def generate(n_templates: int) -> str:
+    lines = []
+    for i in range(n_templates // 4):
+        lines.append(
+            f"{{% if v{i}._in_query %}} ${{t{i}.col}}"
+            f" {{% else %}} '{{{{ _user_attributes['a{i}'] }}}}' {{% endif %}},"
+        )
+    return "select\n" + "\n".join(lines) + "\n1 from t"
+
+
+def main() -> None:
+    print(f"{'templates':>9} {'to_jinja':>9} {'to_liquid':>9}")
+    for n in TEMPLATES:
+        liquid = generate(n)
+
+        start = time.perf_counter()
+        jinja, templates, dummies = template.to_jinja(liquid)
+        to_jinja = time.perf_counter() - start
+
+        start = time.perf_counter()
+        template.to_liquid(jinja, templates, dummies)
+        to_liquid = time.perf_counter() - start
+
+        print(f"{n:>9} {to_jinja:>8.3f}s {to_liquid:>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
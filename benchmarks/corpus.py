@@ -0,0 +1,179 @@
+"""Seeded generator of realistic LookML files.
+
+python -m benchmarks.corpus DIRECTORY [--seed SEED] [--files N]
+"""
+
+import argparse
+import random
+from pathlib import Path
+
+TYPES = ["string", "number", "yesno", "date", "tier"]
+MEASURES = ["count", "sum", "average", "count_distinct", "max"]
+
+
+class Generator:
+    def __init__(self, seed: int) -> None:
+        self.random = random.Random(seed)
+
+    def view(self, name: str, n_dimensions: int) -> str:
+        r = self.random
+        lines = [
+            f"# {self.sentence()}",
+            f"view: {name} {{  # {self.sentence()}",
+            f"  sql_table_name: analytics.{name} ;;",
+            "",
+            self.derived_table(name),
+            "  parameter: granularity {",
+            "    type: unquoted",
+            '    allowed_value: { label: "Day" value: "day" }',
+            '    allowed_value: { label: "Month" value: "month" }',
+            "  }",
+        ]
+        for i in range(n_dimensions):
+            lines.append("")
+            if r.random() < 0.5:
+                lines.append(f"  # {self.sentence()}")
+            lines += [
+                f"  dimension: dimension_{i} {{",
+                f"    type: {r.choice(TYPES)}",
+                f"    sql: {self.expression()} ;;",
+                f'    label: "Dimension {i}"  # {self.sentence()}',
+            ]
+            if r.random() < 0.2:
+                lines.append(f"    html: {self.html(name)} ;;")
+            lines.append("  }")
+        for i in range(n_dimensions // 4):
+            lines += [
+                "",
+                f"  measure: measure_{i} {{",
+                f"    type: {r.choice(MEASURES)}",
+                f"    sql: ${{dimension_{r.randrange(n_dimensions)}}} ;;",
+                f"    drill_fields: [{', '.join(self.fields(name, 4))}]",
+                "  }",
+            ]
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def model(self, views: list[str], depth: int) -> str:
+        lines = ['connection: "warehouse"', 'include: "/views/*.view.lkml"']
+        for view in views:
+            lines += ["", f"explore: {view} {{"]
+            for other in self.random.sample(views, min(3, len(views))):
+                lines += [
+                    f"  join: {other} {{",
+                    "    type: left_outer",
+                    f"    sql_on: ${{{view}.id}} = ${{{other}.{view}_id}} ;;",
+                    "    relationship: many_to_one",
+                    "  }",
+                ]
+            lines += [
+                f'  always_filter: {{ filters: [{view}.dimension_0: "-NULL"] }}',
+                self.aggregate_table(view, depth),
+                "}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def aggregate_table(self, view: str, depth: int, indent: int = 1) -> str:
+        pad = "  " * indent
+        if depth == 0:
+            fields = ", ".join(self.fields(view, 3))
+            return f"{pad}query: {{ dimensions: [{fields}] }}"
+        inner = self.aggregate_table(view, depth - 1, indent + 1)
+        return f"{pad}aggregate_table: level_{depth} {{\n{inner}\n{pad}}}"
+
+    def nested_filters(self, depth: int) -> str:
+        """Arrays of dicts nested `depth` times, which make a deep tree."""
+        lines = ["explore: deep {"]
+        for i in range(depth):
+            pad = "  " * (i + 1)
+            lines.append(f"{pad}access_filter_{i}: [{{")
+            lines.append(f"{pad}  field: {self.fields('deep', 1)[0]}")
+        lines.append("  " * (depth + 1) + 'user_attribute: "region"')
+        for i in reversed(range(depth)):
+            lines.append("  " * (i + 1) + "}]")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def wide_filters(self, width: int) -> str:
+        """A dict with `width` pairs of short arrays, which makes a wide tree."""
+        lines = ["explore: wide {"]
+        for i in range(width):
+            fields = ", ".join(f'{f}: "{i}"' for f in self.fields("wide", 2))
+            lines.append(f"  filters_{i}: [{fields}]  # {self.sentence()}")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def derived_table(self, name: str) -> str:
+        r = self.random
+        columns = []
+        for i in range(r.randrange(5, 15)):
+            columns.append(
+                f"{{% if {name}.dimension_{i}._in_query %}} col_{i}"
+                f" {{% else %}} null {{% endif %}} as col_{i}"
+            )
+        return f"""\
+  derived_table: {{
+    sql:
+      select {", ".join(columns)}
+      from analytics.{name}_raw
+      where {{% condition {name}.dimension_0 %}} col_0 {{% endcondition %}}
+        and created_at >= '{{{{ _user_attributes['start'] }}}}'
+      group by {{% parameter granularity %}}
+    ;;
+  }}
+"""
+
+    def expression(self) -> str:
+        r = self.random
+        columns = [
+            f"${{TABLE}}.col_{r.randrange(50)}" for _ in range(r.randrange(1, 4))
+        ]
+        if len(columns) == 1:
+            return columns[0]
+        return f"case when {columns[0]} > 0 then {' + '.join(columns)} else 0 end"
+
+    def html(self, name: str) -> str:
+        rows = "".join(
+            f'<tr><td class="c{i}">{{{{ value }}}}</td>'
+            f'<td><a href="/explore/{name}?f={i}">{{{{ rendered_value }}}}</a></td>'
+            "</tr>"
+            for i in range(self.random.randrange(3, 30))
+        )
+        return f'<table class="{name}">{rows}</table>'
+
+    def fields(self, name: str, n: int) -> list[str]:
+        return [f"{name}.dimension_{self.random.randrange(8)}" for _ in range(n)]
+
+    def sentence(self) -> str:
+        words = ["total", "amount", "per", "user", "in", "the", "last", "week"]
+        return " ".join(self.random.choices(words, k=self.random.randrange(2, 8)))
+
+
+def generate(
+    seed: int, n_files: int, n_dimensions: int = 40, depth: int = 6
+) -> dict[str, str]:
+    """File names and contents of a LookML project."""
+    gen = Generator(seed)
+    views = [f"view_{i}" for i in range(n_files - 1)]
+    files = {f"{v}.view.lkml": gen.view(v, n_dimensions) for v in views}
+    files["project.model.lkml"] = gen.model(views, depth)
+    return files
+
+
+def write(directory: Path, files: dict[str, str]) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, text in files.items():
+        (directory / name).write_text(text)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--files", type=int, default=20)
+    args = parser.parse_args()
+    write(args.directory, generate(args.seed, args.files))
+
+
+if __name__ == "__main__":
+    main()
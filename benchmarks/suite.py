@@ -0,0 +1,179 @@
+"""Time each phase of lkmlfmt on a generated corpus and compare with a baseline.
+
+python -m benchmarks.suite [--save] [--baseline FILE] [--tolerance RATIO]
+
+Exit with status code 1 if throughput or peak memory of any case is worse than
+the baseline by more than the tolerance.
+Baselines depend on the machine, so save one on the machine which compares.
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+
+from benchmarks import corpus
+from lkmlfmt import parser, template
+from lkmlfmt.cache import code_cache
+from lkmlfmt.formatter import LkmlFormatter, fmt
+
+BASELINE = Path(__file__).parent / "baseline.json"
+SQL = re.compile(r"\bsql:(?P<sql>.*?);;", re.DOTALL)
+MIN_SAMPLE_SECONDS = 0.2  # short cases are repeated to reduce noise
+MIN_PEAK_MIB = 1.0  # smaller differences of peak memory are ignored
+DEPTH = 80  # formatters which recurse on each node fail at about 100
+WIDTH = 2000
+
+Result = dict[str, float]
+
+
+class Suite:
+    def __init__(self, seed: int, n_files: int, repeat: int) -> None:
+        self.files = corpus.generate(seed, n_files)
+        self.lines = sum(len(text.splitlines()) for text in self.files.values())
+        self.sqls = [
+            m.group("sql") for text in self.files.values() for m in SQL.finditer(text)
+        ]
+        self.sql_lines = sum(len(sql.splitlines()) for sql in self.sqls)
+        self.repeat = repeat
+        gen = corpus.Generator(seed)
+        self.deep = gen.nested_filters(DEPTH)
+        self.wide = gen.wide_filters(WIDTH)
+
+    def run(self) -> dict[str, Result]:
+        jinjas = [template.to_jinja(sql) for sql in self.sqls]
+        cases: dict[str, tuple[Callable[[], object], int]] = {
+            "parse": (self.parse, self.lines),
+            "to_jinja": (lambda: [template.to_jinja(s) for s in self.sqls], 0),
+            "to_liquid": (lambda: [template.to_liquid(*j) for j in jinjas], 0),
+            "fmt": (self.fmt, self.lines),
+            "fmt_deep": (partial(fmt, self.deep), len(self.deep.splitlines())),
+            "fmt_wide": (partial(fmt, self.wide), len(self.wide.splitlines())),
+        }
+        results = {}
+        for name, (func, lines) in cases.items():
+            results[name] = self.measure(func, lines or self.sql_lines)
+        results["cli"] = self.cli()
+        return results
+
+    def parse(self) -> None:
+        for text in self.files.values():
+            parser.parse(text)
+
+    def fmt(self) -> None:
+        code_cache.clear()  # formatted code blocks should not be reused
+        for text in self.files.values():
+            LkmlFormatter(text, clickhouse=False, plugins=[]).fmt()
+
+    def measure(self, func: Callable[[], object], lines: int) -> Result:
+        number = max(1, round(MIN_SAMPLE_SECONDS / _time(func)))  # also warm up
+        # the minimum is the least affected by other processes
+        seconds = min(_time(func, number) / number for _ in range(self.repeat))
+
+        # tracemalloc slows down the execution, so it is measured separately
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "seconds": seconds,
+            "lines_per_sec": lines / seconds,
+            "peak_mib": peak / 2**20,
+        }
+
+    def cli(self) -> Result:
+        with tempfile.TemporaryDirectory() as directory:
+            corpus.write(Path(directory), self.files)
+            cmd = [sys.executable, "-m", "lkmlfmt", "--no-cache", "--jobs", "1"]
+            cmd += ["--check", directory]
+
+            def func() -> None:
+                # exit status is 1 because files are not formatted
+                subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False)
+
+            seconds = min(_time(func) for _ in range(self.repeat))
+        return {"seconds": seconds, "lines_per_sec": self.lines / seconds}
+
+
+def compare(
+    results: dict[str, Result], baseline: dict[str, Result], tolerance: float
+) -> list[str]:
+    """Return regressions."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["lines_per_sec"] < base["lines_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: lines/sec")
+        if "peak_mib" in base and result["peak_mib"] > max(
+            base["peak_mib"] * (1 + tolerance), base["peak_mib"] + MIN_PEAK_MIB
+        ):
+            regressions.append(f"{name}: peak memory")
+    return regressions
+
+
+def report(results: dict[str, Result], baseline: dict[str, Result]) -> None:
+    print(
+        f"{'case':<10} {'seconds':>8} {'lines/sec':>10} {'peak MiB':>9} {'vs base':>8}"
+    )
+    for name, r in results.items():
+        peak = f"{r['peak_mib']:>9.1f}" if "peak_mib" in r else f"{'-':>9}"
+        diff = f"{'-':>8}"
+        if name in baseline:
+            ratio = r["lines_per_sec"] / baseline[name]["lines_per_sec"] - 1
+            diff = f"{ratio:>+8.1%}"
+        print(
+            f"{name:<10} {r['seconds']:>8.3f} {r['lines_per_sec']:>10.0f} {peak} {diff}"
+        )
+
+
+def _time(func: Callable[[], object], number: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser_ = argparse.ArgumentParser(description=__doc__)
+    parser_.add_argument("--seed", type=int, default=0)
+    parser_.add_argument("--files", type=int, default=8)
+    parser_.add_argument("--repeat", type=int, default=5)
+    parser_.add_argument("--baseline", type=Path, default=BASELINE)
+    parser_.add_argument("--tolerance", type=float, default=0.15)
+    parser_.add_argument("--save", action="store_true", help="overwrite the baseline")
+    args = parser_.parse_args()
+
+    config = {"seed": args.seed, "files": args.files}
+    baseline = {}
+    if args.baseline.exists() and not args.save:
+        stored = json.loads(args.baseline.read_text())
+        if stored["config"] != config:
+            sys.exit(f"baseline was measured with {stored['config']}")
+        baseline = stored["results"]
+
+    results = Suite(args.seed, args.files, args.repeat).run()
+    report(results, baseline)
+
+    if args.save:
+        stored = {"config": config, "results": results}
+        args.baseline.write_text(json.dumps(stored, indent=2) + "\n")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        print(f"regression: {r}")
+    if 0 < len(regressions):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,23 @@
-from .formatter import fmt
+from typing import TYPE_CHECKING, Any
+
+from .formatter import fmt, fmt_many, fmt_range
+
+if TYPE_CHECKING:
+    from .aio import afmt, afmt_many
 
 __all__ = [
+    "afmt",
+    "afmt_many",
     "fmt",
+    "fmt_many",
+    "fmt_range",
 ]
+
+
+# asyncio is imported only when the async API is used
+def __getattr__(name: str) -> Any:
+    if name in ("afmt", "afmt_many"):
+        from . import aio
+
+        return getattr(aio, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
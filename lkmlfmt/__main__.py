@@ -1,4 +1,4 @@
-from lkmlfmt.command import run
+from lkmlfmt.command import main
 
 if __name__ == "__main__":
-    run()
+    main()
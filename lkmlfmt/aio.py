@@ -0,0 +1,67 @@
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator, Iterable
+from concurrent.futures import Executor
+from functools import partial
+
+from lkmlfmt.formatter import _fmt_chunk
+
+LIMIT = 8
+
+# NOTE
+# the work is done by the executor (the default executor of the loop if None).
+# cancelling a coroutine cancels the work which is not started yet,
+# but the work which is already running is not interrupted
+
+
+async def afmt(
+    lkml: str,
+    clickhouse: bool = False,
+    plugins: list[str] = [],
+    executor: Executor | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+) -> str:
+    """Format LookML without blocking the event loop.
+
+    If semaphore is given, it limits the number of concurrent calls.
+    """
+    if semaphore is None:
+        return await _run(executor, lkml, clickhouse, plugins)
+
+    async with semaphore:
+        return await _run(executor, lkml, clickhouse, plugins)
+
+
+async def afmt_many(
+    lkmls: Iterable[str],
+    clickhouse: bool = False,
+    plugins: list[str] = [],
+    executor: Executor | None = None,
+    limit: int = LIMIT,
+) -> AsyncIterator[str]:
+    """Format LookML strings and yield the results in input order.
+
+    At most `limit` strings are submitted to the executor at once.
+    """
+    it = iter(lkmls)
+    pending: deque[asyncio.Future[str]] = deque()
+    try:
+        while True:
+            while len(pending) < limit and (lkml := next(it, None)) is not None:
+                coro = _run(executor, lkml, clickhouse, plugins)
+                pending.append(asyncio.ensure_future(coro))
+            if len(pending) == 0:
+                return
+            yield await pending.popleft()
+    finally:  # e.g. the consumer is cancelled or stops iteration
+        for future in pending:
+            future.cancel()
+
+
+async def _run(
+    executor: Executor | None, lkml: str, clickhouse: bool, plugins: list[str]
+) -> str:
+    loop = asyncio.get_running_loop()
+    func = partial(_fmt_chunk, [lkml], clickhouse, plugins)
+    (formatted,) = await loop.run_in_executor(executor, func)
+    return formatted
@@ -0,0 +1,86 @@
+import signal
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from lkmlfmt.cache import DiskCache
+
+# path of the file being formatted, which is used in messages
+_location: ContextVar[str] = ContextVar("location", default="<string>")
+
+
+class BlockTimeout(Exception):
+    pass
+
+
+class Budget:
+    """Time limits of formatting in seconds.
+
+    A code block which is not formatted in `block` seconds,
+    or after `file` seconds since the formatting of the file started,
+    is left as it is (re-indented only).
+    If skip is given, such blocks are remembered and not formatted in the future.
+    """
+
+    def __init__(
+        self,
+        block: float | None = None,
+        file: float | None = None,
+        skip: DiskCache | None = None,
+    ) -> None:
+        self.block = block
+        self.file = file
+        self.skip = skip
+
+    # used as a part of the key of the file cache
+    def __repr__(self) -> str:
+        return f"Budget(block={self.block}, file={self.file})"
+
+    def deadline(self) -> float | None:
+        return None if self.file is None else time.monotonic() + self.file
+
+    def remaining(self, deadline: float | None) -> float | None:
+        if deadline is None:
+            return self.block
+        remaining = deadline - time.monotonic()
+        return remaining if self.block is None else min(self.block, remaining)
+
+
+@contextmanager
+def location(path: str) -> Iterator[None]:
+    token = _location.set(path)
+    try:
+        yield
+    finally:
+        _location.reset(token)
+
+
+def current_location() -> str:
+    return _location.get()
+
+
+# NOTE
+# the timer interrupts the block with BlockTimeout only in the main thread on POSIX.
+# otherwise (or if another timer is running) the caller checks the time afterwards
+@contextmanager
+def limit(seconds: float) -> Iterator[None]:
+    if (
+        not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+        or signal.getitimer(signal.ITIMER_REAL)[0] != 0
+    ):
+        yield
+        return
+
+    def handler(signum: int, frame: object) -> None:
+        raise BlockTimeout()
+
+    previous = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from lkmlfmt.budget import Budget
+
+CACHE_DIR = Path(".lkmlfmt_cache")
+MAX_ENTRIES = 50_000
+MAX_CODE_BLOCKS = 4096
+
+CodeKey = tuple[str | int, ...]
+
+
+class DiskCache:
+    """Directory backed key-value store.
+
+    Each entry is a file named after the hash of its key.
+    Entries are written atomically and evicted in LRU order by prune().
+    """
+
+    def __init__(
+        self, directory: Path, salt: str = "", max_entries: int = MAX_ENTRIES
+    ) -> None:
+        self.directory = directory
+        self.salt = salt
+        self.max_entries = max_entries
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            value = path.read_bytes().decode()
+            os.utime(path)  # mark as recently used
+        except OSError:  # not cached or evicted by another process
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        path = self._path(key)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first so that readers never see partial data
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value.encode())
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def prune(self) -> None:
+        try:
+            entries = [
+                e
+                for e in os.scandir(self.directory)
+                if e.is_file() and not e.name.startswith(".")
+            ]
+        except FileNotFoundError:
+            return
+
+        if len(entries) <= self.max_entries:
+            return
+
+        def mtime(entry: os.DirEntry[str]) -> float:
+            try:
+                return entry.stat().st_mtime
+            except FileNotFoundError:
+                return 0
+
+        entries.sort(key=mtime)
+        for e in entries[: len(entries) - self.max_entries]:
+            Path(e.path).unlink(missing_ok=True)
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(f"{self.salt}\0{key}".encode()).hexdigest()
+        return self.directory / digest
+
+
+class CodeCache:
+    """Bounded LRU memo of formatted code blocks.
+
+    If disk is set, entries are also persisted across processes.
+    hits includes disk_hits.
+    It is thread-safe, but the disk is accessed without holding the lock.
+    """
+
+    def __init__(
+        self, maxsize: int = MAX_CODE_BLOCKS, disk: DiskCache | None = None
+    ) -> None:
+        self.maxsize = maxsize
+        self.disk = disk
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[CodeKey, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: CodeKey) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        disk = self.disk
+        if disk is not None and (value := disk.get(repr(key))) is not None:
+            with self._lock:
+                self._put(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: CodeKey, value: str) -> None:
+        with self._lock:
+            self._put(key, value)
+        disk = self.disk
+        if disk is not None:
+            disk.set(repr(key), value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    # the lock must be held
+    def _put(self, key: CodeKey, value: str) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while self.maxsize < len(self._entries):
+            self._entries.popitem(last=False)
+
+
+# shared by all formatters in the process
+code_cache = CodeCache()
+
+
+def file_cache(
+    root: Path, clickhouse: bool, plugins: list[str], budget: "Budget | None" = None
+) -> DiskCache:
+    """Cache of file contents which are known to be formatted."""
+    _init_root(root)
+    return DiskCache(root / "files", salt=config(clickhouse, plugins, budget))
+
+
+def code_disk_cache(root: Path) -> DiskCache:
+    """Cache of formatted code blocks. Keys contain the mode and the plugin."""
+    _init_root(root)
+    return DiskCache(root / "code", salt=_versions())
+
+
+def slow_block_cache(root: Path) -> DiskCache:
+    """Code blocks which were not formatted in time. Values are not used."""
+    _init_root(root)
+    return DiskCache(root / "slow", salt=_versions())
+
+
+def config(clickhouse: bool, plugins: list[str], budget: "Budget | None" = None) -> str:
+    res = f"{_versions()}\0{clickhouse}\0{','.join(plugins)}"
+    # slow blocks may be left as they are
+    return res if budget is None else f"{res}\0{budget!r}"
+
+
+def _versions() -> str:
+    return f"{_version('lkmlfmt')}\0{_version('shandy-sqlfmt')}"
+
+
+def _version(distribution: str) -> str:
+    from importlib import metadata
+
+    try:
+        return metadata.version(distribution)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _init_root(root: Path) -> None:
+    root.mkdir(parents=True, exist_ok=True)
+    # the cache should not be committed
+    gitignore = root / ".gitignore"
+    if not gitignore.exists():
+        gitignore.write_text("*\n")
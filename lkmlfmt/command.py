@@ -1,17 +1,83 @@
-import difflib
+import importlib.util
+import json
 import logging
+import os
 import sys
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeVar
 
 import click
+from lark import UnexpectedInput
 
-from lkmlfmt.formatter import fmt
+from lkmlfmt.budget import Budget, location
+from lkmlfmt.cache import (
+    CACHE_DIR,
+    DiskCache,
+    code_cache,
+    code_disk_cache,
+    file_cache,
+    slow_block_cache,
+)
+from lkmlfmt.exception import LkmlfmtException
+from lkmlfmt.formatter import LkmlFormatter
+from lkmlfmt.git import changed_files
 from lkmlfmt.logger import logger
+from lkmlfmt.stats import Stats, collect
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from lkmlfmt.daemon import Client
+
+T = TypeVar("T")
+STDIN = Path("-")
+# code blocks of a file are formatted in parallel only if there are enough of them
+MIN_PARALLEL_BLOCKS = 64
+
+
+class DefaultGroup(click.Group):
+    """Group which invokes the default command if no command is specified."""
+
+    def __init__(self, *args: Any, default: str, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.default = default
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        # `lkmlfmt [OPTIONS] [FILE]...` is equivalent to `lkmlfmt format ...`
+        if len(args) == 0 or args[0] not in self.commands:
+            args = [self.default, *args]
+        return super().parse_args(ctx, args)
+
 
+@click.group(cls=DefaultGroup, default="format")
+def main() -> None:
+    """Format LookML file(s)."""
 
-@click.command()
-@click.argument("file", type=click.Path(exists=True, path_type=Path), nargs=-1)
+
+def _default_socket() -> Path:
+    from lkmlfmt.daemon import default_socket
+
+    return default_socket()
+
+
+socket_option = click.option(
+    "--socket",
+    "socket_",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=_default_socket,
+    help="Unix domain socket of the daemon.",
+)
+
+
+@click.command(
+    "format", epilog="See also `lkmlfmt daemon --help` and `lkmlfmt lsp --help`."
+)
+@click.argument(
+    "file", type=click.Path(exists=True, allow_dash=True, path_type=Path), nargs=-1
+)
 @click.option(
     "--check",
     is_flag=True,
@@ -37,26 +103,239 @@ Instead, exit with status code 1 if any file should be modefied.",
     type=str,
     multiple=True,
     default=[],
+    callback=lambda ctx, param, value: tuple(_find_plugin(v) for v in value),
     help="A plugin to fmt looker expression, sql or html.",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    help="\
+Number of processes to format files (or code blocks of a large file) in parallel. \
+Defaults to CPU count.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help=f"Don't read or write the cache of formatted files in {CACHE_DIR}.",
+)
+@click.option(
+    "--changed-since",
+    metavar="REF",
+    help="\
+Only format files which are changed since the merge base of REF and HEAD \
+(e.g. origin/main) according to git.",
+)
+@click.option(
+    "--lines",
+    "ranges",
+    metavar="START:END",
+    multiple=True,
+    callback=lambda ctx, param, value: [_parse_range(v) for v in value],
+    help="\
+Only format top level blocks overlapping with the lines (1-based, inclusive). \
+Can be specified multiple times.",
+)
+@click.option(
+    "--use-daemon",
+    is_flag=True,
+    help="Format files in the daemon if it is running.",
+)
+@socket_option
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running and format files again when they are modified.",
+)
+@click.option(
+    "--stdin-ndjson",
+    is_flag=True,
+    help="""\
+Read {"path": ..., "content": ...} records from stdin, one JSON per line, \
+and write formatted records to stdout in the order they are completed. \
+If formatting fails, the record has "error" instead of "content".""",
+)
+@click.option(
+    "--stats-json",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="\
+Write wall time and call counts of each phase, the time of each file \
+and the slowest code blocks to the JSON file.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="\
+Write cProfile stats to the file, which can be read by pstats. \
+Files are formatted in this process as if `--jobs 1` is specified.",
+)
+@click.option(
+    "--block-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    metavar="SECONDS",
+    help=f"\
+Leave code blocks which are not formatted in SECONDS as they are (re-indented only). \
+They are remembered in {CACHE_DIR} and not formatted again.",
+)
+@click.option(
+    "--file-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    metavar="SECONDS",
+    help="\
+Leave code blocks as they are (re-indented only) \
+once formatting a file takes more than SECONDS.",
+)
 def run(
-    file: list[Path], check: bool, clickhouse: bool, log_level: str, plugins: list[str]
+    file: list[Path],
+    check: bool,
+    clickhouse: bool,
+    log_level: str,
+    plugins: list[str],
+    jobs: int,
+    no_cache: bool,
+    changed_since: str | None,
+    ranges: list[tuple[int, int]],
+    use_daemon: bool,
+    socket_: Path,
+    watch: bool,
+    stdin_ndjson: bool,
+    stats_json: Path | None,
+    profile: Path | None,
+    block_timeout: float | None,
+    file_timeout: float | None,
 ) -> None:
     """Format LookML file(s).
 
     FILE is the LookML file(s) to format (directory is also OK).
     Files which does not end with `.lkml` will be ignored.
+    If FILE is `-`, read LookML from stdin and write the result to stdout.
     """
     level = getattr(logging, log_level)
     logging.basicConfig(level=level)
 
-    modified: list[bool] = []
+    stdin = STDIN in file
+    if watch and check:
+        raise click.UsageError("--watch cannot be used with --check")
+    if stdin and (len(file) != 1 or watch):
+        raise click.UsageError("- cannot be used with other FILE or --watch")
+    if stdin_ndjson and (0 < len(file) or check or watch):
+        raise click.UsageError(
+            "--stdin-ndjson cannot be used with FILE, --check or --watch"
+        )
+    if stats_json is not None and (stdin or stdin_ndjson):
+        raise click.UsageError("--stats-json cannot be used with - or --stdin-ndjson")
+
+    profiler = None
+    if profile is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        jobs = 1  # workers are not profiled
+
+    budget = None
+    if block_timeout is not None or file_timeout is not None:
+        skip = None if no_cache else slow_block_cache(CACHE_DIR)
+        budget = Budget(block_timeout, file_timeout, skip)
+
+    # code_cache is shared by the process, which may call lkmlfmt again later
+    code_disk = code_cache.disk
+    try:
+        cache = None
+        code_cache.disk = None
+        if not no_cache:
+            # partially formatted files should not be cached
+            if len(ranges) == 0:
+                cache = file_cache(CACHE_DIR, clickhouse, plugins, budget)
+            code_cache.disk = code_disk_cache(CACHE_DIR)
+
+        client = None
+        if use_daemon:
+            from lkmlfmt import daemon
+
+            client = daemon.connect(socket_)
+            if client is None:
+                logger.info(f"daemon is not running on {socket_}, format in-process")
+            else:
+                jobs = 1  # the connection cannot be shared with workers
+
+        func = partial(
+            fmt_text,
+            clickhouse=clickhouse,
+            plugins=plugins,
+            cache=cache,
+            ranges=ranges if 0 < len(ranges) else None,
+            client=client,
+            budget=budget,
+        )
 
-    for f in filter_lkml(file):
-        logger.debug(f"formatting {f}")
-        before = f.read_text()
-        after = fmt(before, clickhouse, plugins)
+        stats_ = None if stats_json is None else Stats()
+        modified = []
+        if stdin:
+            modified.append(_fmt_stdin(func, check))
+        elif stdin_ndjson:
+            _fmt_ndjson(func, jobs)
+        else:
+            files = filter_lkml(file)
+            if changed_since is not None and 0 < len(file):
+                # NOTE
+                # FILE may be in another repository than the current directory
+                cwd = file[0] if file[0].is_dir() else file[0].parent
+                try:
+                    changed = {f.resolve() for f in changed_files(changed_since, cwd)}
+                except LkmlfmtException as e:
+                    raise click.ClickException(str(e)) from e
+                files = [f for f in files if f.resolve() in changed]
+
+            # code blocks formatted in workers of the block pool are not collected
+            block_jobs = jobs if len(files) == 1 and stats_ is None else 1
+            with _block_pool(block_jobs) as executor:
+                file_func = partial(fmt_file, func=partial(func, executor=executor))
+                if stats_ is None:
+                    results = _map(file_func, files, jobs)
+                else:
+                    collect_func = partial(_collect_stats, file_func)
+                    results = _merge_stats(stats_, _map(collect_func, files, jobs))
+                try:
+                    modified = _apply(files, results, check)
+                except LkmlfmtException as e:
+                    raise click.ClickException(str(e)) from e
+            _summarize(modified)
+
+            if watch:
+                _watch(file, partial(fmt_file, func=func))
+
+        if client is not None:
+            client.close()
+        if cache is not None:
+            cache.prune()
+        if code_cache.disk is not None:
+            code_cache.disk.prune()
+        if budget is not None and budget.skip is not None:
+            budget.skip.prune()
+        logger.debug(
+            f"code cache: {code_cache.hits} hits "
+            f"({code_cache.disk_hits} from disk), {code_cache.misses} misses"
+        )
+        if stats_json is not None and stats_ is not None:
+            stats_json.write_text(json.dumps(stats_.report(), indent=2) + "\n")
+        if profiler is not None and profile is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+    finally:
+        code_cache.disk = code_disk
 
+    if check and any(modified):
+        sys.exit(1)
+
+
+def _apply(
+    files: list[Path], results: Iterable[tuple[str, str]], check: bool
+) -> list[bool]:
+    modified = []
+    # results are yielded in input order, so are the messages
+    for f, (before, after) in zip(files, results):
         if before == after:
             click.echo(f"{f} is skipped")
             modified.append(False)
@@ -69,17 +348,270 @@ def run(
             print_diff(before, after, str(f))
         else:
             f.write_text(after)
+    return modified
+
 
+def _summarize(modified: list[bool]) -> None:
     # https://stackoverflow.com/questions/12765833/counting-the-number-of-true-booleans-in-a-python-list
     n_modified = modified.count(True)
     n_skipped = len(modified) - n_modified
     click.echo(f"{n_modified} files are modified, {n_skipped} files are skipped.")
 
-    if n_modified > 0 and check:
-        sys.exit(1)
 
+# NOTE
+# files are formatted in this process to reuse the warm parser and sqlfmt.
+# the batches are usually small, so it is faster than starting workers every time
+def _watch(paths: list[Path], func: Callable[[Path], tuple[str, str]]) -> None:
+    from lkmlfmt.watch import Watcher
+
+    watcher = Watcher(partial(filter_lkml, paths))
+    click.echo("Watching for changes. Press Ctrl+C to stop.")
+    try:
+        for batch in watcher.batches():
+            modified = []
+            for f in batch:
+                try:
+                    result = func(f)
+                except Exception as e:  # e.g. the file is being edited
+                    click.echo(f"{f} is not formatted: {e}", err=True)
+                    continue
+                modified += _apply([f], [result], check=False)
+                watcher.record(f)  # not to format it again
+            _summarize(modified)
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command("daemon")
+@socket_option
+def daemon_command(socket_: Path) -> None:
+    """Keep lkmlfmt warm and format LookML sent by `lkmlfmt --use-daemon`."""
+    from lkmlfmt import daemon
+
+    try:
+        server = daemon.make_server(socket_)
+    except LkmlfmtException as e:
+        raise click.ClickException(str(e)) from e
+
+    click.echo(f"listening on {socket_}")
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+@click.command("lsp")
+@click.option(
+    "--clickhouse",
+    is_flag=True,
+    help="Specify `--dialect clickhouse` option when using sqlfmt.",
+)
+@click.option(
+    "--plugin",
+    "plugins",
+    type=str,
+    multiple=True,
+    default=[],
+    callback=lambda ctx, param, value: tuple(_find_plugin(v) for v in value),
+    help="A plugin to fmt looker expression, sql or html.",
+)
+def lsp_command(clickhouse: bool, plugins: list[str]) -> None:
+    """Run the language server over stdio."""
+    from lkmlfmt import lsp
+
+    server = lsp.Server(sys.stdin.buffer, sys.stdout.buffer, clickhouse, plugins)
+    sys.exit(server.serve())
+
+
+main.add_command(run)
+main.add_command(daemon_command)
+main.add_command(lsp_command)
+
+
+def fmt_file(file: Path, func: Callable[[str], str]) -> tuple[str, str]:
+    logger.debug(f"formatting {file}")
+    before = file.read_text()
+    with location(str(file)):
+        try:
+            return before, func(before)
+        except UnexpectedInput as e:
+            # lark exceptions cannot be pickled to be sent from worker processes
+            raise LkmlfmtException(f"{file}: {e}") from None
+
+
+def fmt_text(
+    before: str,
+    clickhouse: bool,
+    plugins: list[str],
+    cache: DiskCache | None = None,
+    ranges: list[tuple[int, int]] | None = None,
+    client: "Client | None" = None,
+    budget: Budget | None = None,
+    executor: "Executor | None" = None,
+) -> str:
+    if cache is not None and cache.get(before) is not None:
+        logger.debug("known to be formatted")
+        return before
+
+    degraded = False
+    if client is not None:
+        after = client.fmt(before, clickhouse, plugins, ranges)
+    else:
+        formatter = LkmlFormatter(before, clickhouse, plugins, budget)
+        if ranges is not None:
+            after = formatter.fmt_range(ranges)
+        else:
+            # NOTE workers are started lazily, so small files do not pay for them
+            if executor is not None and MIN_PARALLEL_BLOCKS <= before.count(";;"):
+                formatter.prefill(executor)
+            after = formatter.fmt()
+        degraded = formatter.degraded
+    # some blocks may be formatted next time (e.g. when the machine is not busy)
+    if cache is not None and not degraded:
+        cache.set(after, "")
+    return after
+
+
+def _fmt_stdin(func: Callable[[str], str], check: bool) -> bool:
+    before = sys.stdin.read()
+    with location("<stdin>"):
+        try:
+            after = func(before)
+        except UnexpectedInput as e:
+            raise click.ClickException(f"<stdin>: {e}") from None
+    if check:
+        print_diff(before, after, STDIN.name)
+    else:
+        click.echo(after, nl=False)
+    return before != after
 
-def filter_lkml(files: Iterable[Path]) -> Iterable[Path]:
+
+def _fmt_ndjson(func: Callable[[str], str], jobs: int) -> None:
+    def emit(record: dict[str, Any]) -> None:
+        sys.stdout.write(json.dumps(record) + "\n")
+        sys.stdout.flush()
+
+    lines = (line for line in sys.stdin if line.strip() != "")
+    _stream(partial(fmt_record, func=func), lines, jobs, emit)
+
+
+def fmt_record(line: str, func: Callable[[str], str]) -> dict[str, Any]:
+    path = None
+    try:
+        record = json.loads(line)
+        path = record.get("path")
+        return {"path": path, "content": func(record["content"])}
+    except Exception as e:
+        return {"path": path, "error": f"{type(e).__name__}: {e}"}
+
+
+# NOTE
+# sqlfmt is written in pure python,
+# so use processes instead of threads to escape from the GIL
+def _map(func: Callable[[Path], T], files: list[Path], jobs: int) -> Iterator[T]:
+    if jobs < 2 or len(files) < 2:
+        yield from map(func, files)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = min(jobs, len(files))
+    chunksize = max(1, len(files) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(code_cache.disk,)
+    ) as executor:
+        yield from executor.map(func, files, chunksize=chunksize)
+
+
+# NOTE
+# results are emitted by the callback as soon as they are completed,
+# even while the main thread is waiting for the next input
+def _stream(
+    func: Callable[[str], T],
+    items: Iterable[str],
+    jobs: int,
+    emit: Callable[[T], None],
+) -> None:
+    if jobs < 2:
+        for item in items:
+            emit(func(item))
+        return
+
+    import threading
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(jobs * 4)  # bound memory usage
+
+    def done(future: Future[T]) -> None:
+        try:
+            with lock:
+                emit(future.result())
+        finally:
+            slots.release()
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(code_cache.disk,)
+    ) as executor:
+        for item in items:
+            slots.acquire()
+            executor.submit(func, item).add_done_callback(done)
+
+
+# NOTE
+# a single file cannot be split among workers, but its code blocks can
+@contextmanager
+def _block_pool(jobs: int) -> "Iterator[Executor | None]":
+    if jobs < 2:
+        yield None
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(code_cache.disk,)
+    ) as executor:
+        yield executor
+
+
+def _collect_stats(func: Callable[[Path], T], file: Path) -> tuple[T, Stats]:
+    stats_ = Stats()
+    with collect(stats_), stats_.file(str(file)):
+        return func(file), stats_
+
+
+def _merge_stats(stats_: Stats, results: Iterable[tuple[T, Stats]]) -> Iterator[T]:
+    for result, s in results:
+        stats_.merge(s)
+        yield result
+
+
+def _init_worker(code_disk: DiskCache | None) -> None:
+    code_cache.disk = code_disk
+
+
+def _parse_range(value: str) -> tuple[int, int]:
+    start, sep, end = value.partition(":")
+    if sep != "" and start.isdigit() and end.isdigit() and int(start) <= int(end):
+        return int(start), int(end)
+    raise click.BadParameter(f"{value} is not START:END")
+
+
+def _find_plugin(name: str) -> str:
+    # NOTE
+    # plugins are imported lazily (and not at all if files are cached),
+    # but misspelled names should be reported before formatting
+    try:
+        found = importlib.util.find_spec(name) is not None
+    except ImportError:  # the parent package is not found
+        found = False
+    if not found:
+        raise click.BadParameter(f"{name} is not found")
+    return name
+
+
+def filter_lkml(files: Iterable[Path]) -> list[Path]:
     res = []
 
     for f in files:
@@ -93,6 +625,8 @@ def filter_lkml(files: Iterable[Path]) -> Iterable[Path]:
 
 
 def print_diff(a: str, b: str, file: str = "") -> None:
+    import difflib
+
     diffs = difflib.unified_diff(
         a.splitlines(), b.splitlines(), fromfile=file, tofile=file
     )
@@ -0,0 +1,137 @@
+import getpass
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from lkmlfmt.exception import LkmlfmtException
+from lkmlfmt.formatter import fmt, fmt_range
+from lkmlfmt.logger import logger
+
+# NOTE
+# the protocol is newline delimited JSON.
+# request: {"lkml": str, "clickhouse": bool, "plugins": [str], "ranges": [[int, int]]}
+# response: {"lkml": str} or {"error": str}
+# a connection can be used for multiple requests
+
+
+# NOTE
+# other users must not be able to serve or read the LookML of the user.
+# the socket is created in a directory of the user with mode 0600,
+# and the client refuses sockets which do not satisfy it
+
+
+def default_socket() -> Path:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:  # only the user can access it
+        return Path(runtime) / f"lkmlfmt-{getpass.getuser()}.sock"
+    # the private directory is created by make_server()
+    return Path(tempfile.gettempdir()) / f"lkmlfmt-{getpass.getuser()}" / "daemon.sock"
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                res = {"lkml": handle_request(json.loads(line))}
+            except Exception as e:
+                logger.exception("failed to handle a request")
+                res = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(res).encode() + b"\n")
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_close(self) -> None:
+        super().server_close()
+        Path(self.server_address).unlink(missing_ok=True)  # type: ignore
+
+
+def handle_request(req: dict[str, Any]) -> str:
+    lkml, clickhouse, plugins = req["lkml"], req["clickhouse"], req["plugins"]
+    ranges = req.get("ranges")
+    if ranges is None:
+        return fmt(lkml, clickhouse, plugins)
+    return fmt_range(lkml, [(s, e) for s, e in ranges], clickhouse, plugins)
+
+
+def make_server(path: Path) -> Server:
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if path.parent.stat().st_uid != os.getuid():
+        raise LkmlfmtException(f"{path.parent} is owned by another user")
+
+    if path.exists():
+        if connect(path) is not None:
+            raise LkmlfmtException(f"daemon is already running on {path}")
+        path.unlink()  # left by a daemon which was killed
+
+    # warm up the parser and sqlfmt
+    fmt("sql: select 1 ;;")
+
+    # the socket should not be accessible even for a moment after bind()
+    umask = os.umask(0o177)
+    try:
+        return Server(str(path), Handler)
+    finally:
+        os.umask(umask)
+
+
+class Client:
+    def __init__(self, path: Path) -> None:
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(str(path))
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile("rwb")
+
+    def fmt(
+        self,
+        lkml: str,
+        clickhouse: bool = False,
+        plugins: list[str] = [],
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> str:
+        req = {
+            "lkml": lkml,
+            "clickhouse": clickhouse,
+            "plugins": plugins,
+            "ranges": ranges,
+        }
+        self.file.write(json.dumps(req).encode() + b"\n")
+        self.file.flush()
+
+        line = self.file.readline()
+        if line == b"":
+            raise LkmlfmtException("daemon closed the connection")
+        res = json.loads(line)
+        if "error" in res:
+            raise LkmlfmtException(res["error"])
+        return str(res["lkml"])
+
+    def close(self) -> None:
+        self.file.close()
+        self.socket.close()
+
+
+def connect(path: Path) -> Client | None:
+    """Return None if the daemon is not running (or not trusted)."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o600:
+        logger.warning(f"{path} is ignored because it is not private to the user")
+        return None
+
+    try:
+        return Client(path)
+    except OSError:
+        return None
@@ -1,35 +1,112 @@
 import importlib
 import re
+import textwrap
+import time
+from collections import deque
 from contextlib import contextmanager
-from typing import Generator
+from functools import cache, partial
+from itertools import accumulate, islice
+from types import ModuleType
+from typing import TYPE_CHECKING, Callable, Generator, Iterable, Iterator, TypeAlias
 
-from lark import ParseTree, Token
-from sqlfmt import api
-from sqlfmt.line import Line
+from lark import ParseTree, Token, Tree, UnexpectedInput
 
-from lkmlfmt import parser, template
+from lkmlfmt import budget, parser, stats, template
+from lkmlfmt.budget import BlockTimeout, Budget, location
+from lkmlfmt.cache import code_cache
 from lkmlfmt.exception import LkmlfmtException
 from lkmlfmt.logger import logger
 
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
 COMMENT_MARKER = "#LKMLFMT_MARKER#"
 COMMENT = re.compile(rf"{COMMENT_MARKER}")
 BLANK_LINE = re.compile(r"^\s*$")
 ESCAPED_STRING_SINGLE = re.compile(r'"(?P<inner>(.|\n)*?(?<!\\)(\\\\)*?)"')
 ESCAPED_STRING_TRIPLE = re.compile(r'"""(?P<inner>(.|\n)*?(?<!\\)(\\\\)*?)"""')
 NOT_AND_OR = re.compile(r"(?<!\w)(not|and|or)(?!\w)")
+# anonymous tokens which may follow the last token of a pair (e.g. `key: {}`)
+CLOSING = re.compile(r"(?:\s+|#.*|(?P<closing>[:{}\[\],]))*")
 INDENT_WIDTH = 2
+CHUNKSIZE = 16
+MAX_PENDING_CHUNKS = 64
+BLOCK_CHUNKSIZE = 4
+
+# (key, code, indent, line) of a code block
+Block = tuple[str, str, int, int]
+Node = ParseTree | Token | list[ParseTree | Token]
+# yields a child node (or a generator) and receives its formatted string
+Fmt: TypeAlias = Generator["Node | Fmt", str, str]
+
+
+class CommentCursor:
+    """Comments bucketed by line number.
+
+    Leading comments are consumed in order by moving the cursor,
+    trailing comments are consumed by line number.
+    Each line has at most one comment because it lasts until the end of line.
+    """
+
+    def __init__(self, comments: list[Token]) -> None:
+        self.lines = [c.line for c in comments if c.line is not None]
+        self.comments = {c.line: c for c in comments if c.line is not None}
+        self.cursor = 0
+
+    def pop_before(self, line: int) -> list[Token]:
+        popped = []
+        while self.cursor < len(self.lines) and self.lines[self.cursor] < line:
+            # it may be already popped as a trailing comment
+            if (
+                comment := self.comments.pop(self.lines[self.cursor], None)
+            ) is not None:
+                popped.append(comment)
+            self.cursor += 1
+        return popped
+
+    def pop_at(self, line: int) -> list[Token]:
+        comment = self.comments.pop(line, None)
+        return [] if comment is None else [comment]
+
+    def pop_all(self) -> list[Token]:
+        popped = [self.comments[line] for line in self.lines if line in self.comments]
+        self.comments.clear()
+        self.cursor = len(self.lines)
+        return popped
 
 
 class LkmlFormatter:
-    def __init__(self, lkml: str, clickhouse: bool, plugins: list[str]) -> None:
+    def __init__(
+        self,
+        lkml: str,
+        clickhouse: bool,
+        plugins: list[str],
+        budget: Budget | None = None,
+    ) -> None:
+        self.budget = budget
+        self.deadline = None if budget is None else budget.deadline()
         self.lkml = lkml
         self.curr_indent = 0
+        # blank_lines[i] is the number of blank lines in lkml.splitlines()[:i]
+        self.blank_lines = list(
+            accumulate(
+                (BLANK_LINE.match(line) is not None for line in lkml.splitlines()),
+                initial=0,
+            )
+        )
 
-        tree, comments = parser.parse(lkml, set_position=True)
+        tree, comments = parser.parse(lkml)
         self.tree = tree
-        self.comments = comments
-        self.mode = api.Mode(dialect_name="clickhouse" if clickhouse else "polyglot")
-        self.plugins = [importlib.import_module(p) for p in plugins]
+        self.comments = CommentCursor(comments)
+        self.dialect = "clickhouse" if clickhouse else "polyglot"
+        self.plugin_names = plugins
+        # fail fast even if no code block needs them (imported once per process)
+        for name in plugins:
+            _import_plugin(name)
+        # code blocks formatted in advance by prefill(), keyed by (key, indent, code)
+        self.formatted: dict[tuple[str, int, str], str] = {}
+        # True if some code blocks are only re-indented because of the budget
+        self.degraded = False
 
     # NOTE
     # parents take care of self.curr_indent, but children call fmt_indent()
@@ -40,7 +117,40 @@ class LkmlFormatter:
         sep: str = "",
     ) -> str:
         t = self.tree if tree is None else tree
+        return self._run(self._fmt(t, sep))
+
+    # NOTE
+    # deeply nested LookML would exceed the recursion limit,
+    # so methods of nodes which have subtrees are generators.
+    # they yield a child (or a generator) and receive its formatted string
+    # instead of calling fmt() recursively, and _run() drives them with a stack
+    def _run(self, result: str | Fmt) -> str:
+        stack: list[Fmt] = []
+        while True:
+            if isinstance(result, str):
+                if len(stack) == 0:
+                    return result
+                try:
+                    request = stack[-1].send(result)
+                except StopIteration as e:
+                    stack.pop()
+                    result = e.value
+                    continue
+            else:
+                try:
+                    request = next(result)
+                except StopIteration as e:
+                    result = e.value
+                    continue
+                stack.append(result)
+            if isinstance(request, Token):  # the most common case
+                result = self.fmt_token(request)
+            elif isinstance(request, (Tree, list)):
+                result = self._fmt(request)
+            else:
+                result = request
 
+    def _fmt(self, t: Node, sep: str = "") -> str | Fmt:
         if isinstance(t, list):
             return self.fmt_trees(t, sep)
 
@@ -51,7 +161,9 @@ class LkmlFormatter:
             case "arr":
                 return self.fmt_arr(t)
             case "code_pair":
-                return self.fmt_code_pair(t)
+                key = _token(t.children[0])
+                with stats.block(str(key), key.line or 0):
+                    return self.fmt_code_pair(t)
             case "dict":
                 return self.fmt_dict(t)
             case "lkml":
@@ -64,12 +176,12 @@ class LkmlFormatter:
                 logger.warning(f"unknown data: {t.data}")
                 raise LkmlfmtException()
 
-    def fmt_arr(self, arr: ParseTree) -> str:
+    def fmt_arr(self, arr: ParseTree) -> Fmt:
         if arr.children[0] is None:
             return f"{self.fmt_indent()}[]"
 
         with self.indent():
-            values = self.fmt(arr.children, ",")
+            values = yield self.fmt_trees(arr.children, ",")
 
         if "\n" not in values:
             return f"{self.fmt_indent()}[{values.lstrip()}]"
@@ -86,6 +198,7 @@ class LkmlFormatter:
         tcomments = self.fmt_trailing_comments_of(_token(pair.children[0]))
 
         key = self.fmt(pair.children[0]).lstrip()
+        line = _token(pair.children[0]).line or 0
         value = str(pair.children[1])
         end = str(pair.children[2]) + self.fmt_trailing_comments_of(
             _token(pair.children[2])
@@ -93,11 +206,7 @@ class LkmlFormatter:
 
         if key.startswith("html"):
             with self.indent():
-                formatted = self._try_plugins(value, "fmt_html")
-                if formatted is not None:
-                    value = formatted
-                else:
-                    value = self._fmt_html(value)
+                value = self.fmt_code(key, value, line)
 
             if "\n" not in value:
                 return (
@@ -111,24 +220,7 @@ class LkmlFormatter:
 
         # sql_xxx: ... ;; or expression_xxx: ... ;;
         with self.indent():
-            # https://docs.python.org/3/library/functions.html#property
-            Line.prefix = property(  # type: ignore
-                lambda s: " "
-                * INDENT_WIDTH
-                * (s.depth[0] + s.depth[1] + self.curr_indent)
-            )
-            if key.startswith("sql"):
-                formatted = self._try_plugins(value, "fmt_sql")
-                if formatted is not None:
-                    value = formatted
-                else:
-                    value = self._fmt_sql(value)
-            else:
-                formatted = self._try_plugins(value, "fmt_expr")
-                if formatted is not None:
-                    value = formatted
-                else:
-                    value = self._fmt_expr(value)
+            value = self.fmt_code(key, value, line)
 
         if "\n" not in value:
             return (
@@ -143,9 +235,123 @@ class LkmlFormatter:
 {value}
 {self.fmt_indent()}{end}{tcomments}"""
 
-    def fmt_dict(self, dict_: ParseTree) -> str:
+    def fmt_code(self, key: str, code: str, line: int) -> str:
+        formatted = self.formatted.get((key, self.curr_indent, code))
+        if formatted is not None:
+            return formatted
+
+        if self.budget is None:
+            return self._fmt_code(key, code)
+        seconds = self.budget.remaining(self.deadline)
+        if seconds is None:
+            return self._fmt_code(key, code)
+
+        skip = self.budget.skip
+        skip_key = repr((key, self.dialect, self.plugin_names, code))
+        if skip is not None and skip.get(skip_key) is not None:
+            reason = "is known to be slow"
+        elif seconds <= 0:
+            reason = "is not formatted because the file is out of time"
+        else:
+            # the block should not be charged for importing sqlfmt or plugins
+            self._warm_up(key)
+            start = time.monotonic()
+            try:
+                with budget.limit(seconds):
+                    formatted = self._fmt_code(key, code)
+                if time.monotonic() - start <= seconds:
+                    return formatted
+            except BlockTimeout:
+                pass
+            reason = f"is not formatted in {seconds:.1f}s"
+            # it may be interrupted because of the file budget
+            if skip is not None and seconds == self.budget.block:
+                skip.set(skip_key, "")
+
+        logger.warning(
+            f"{budget.current_location()}:{line}: {key} {reason}, "
+            "so it is re-indented only"
+        )
+        self.degraded = True
+        return self._reindent(code)
+
+    # NOTE
+    # this is the first phase of the two-phase mode.
+    # code blocks are independent of each other, so they are formatted in parallel
+    # and the second phase (fmt()) just looks them up
+    def prefill(self, executor: "Executor") -> None:
+        """Format code blocks of the whole tree in advance using executor.
+
+        Blocks which are not formatted before the file budget runs out
+        are left to the second phase.
+        """
+        from concurrent.futures import wait
+
+        blocks = {(k, c, i): line for k, c, i, line in _code_blocks(self.tree, 0)}
+        if len(blocks) < 2:
+            return
+
+        items = [(k, c, i, line) for (k, c, i), line in blocks.items()]
+        func = partial(
+            _fmt_blocks,
+            clickhouse=self.dialect == "clickhouse",
+            plugins=self.plugin_names,
+            budget=self.budget,
+            deadline=self.deadline,
+            path=budget.current_location(),
+        )
+        futures = {
+            executor.submit(func, chunk): chunk
+            for chunk in (
+                items[i : i + BLOCK_CHUNKSIZE]
+                for i in range(0, len(items), BLOCK_CHUNKSIZE)
+            )
+        }
+        timeout = None
+        if self.deadline is not None:
+            timeout = max(0, self.deadline - time.monotonic())
+        done, not_done = wait(futures, timeout)
+        for future in not_done:
+            future.cancel()
+
+        for future in done:
+            results, degraded = future.result()
+            self.degraded |= degraded
+            for (key, code, indent, _), formatted in zip(futures[future], results):
+                self.formatted[key, indent, code] = formatted
+
+    def _warm_up(self, key: str) -> None:
+        plugin = _plugin_func(key)
+        if any(hasattr(p, plugin) for p in map(_import_plugin, self.plugin_names)):
+            return
+        if plugin != "fmt_html":
+            from lkmlfmt import sql
+
+            sql.warm_up(self.dialect)
+
+    def _fmt_code(self, key: str, code: str) -> str:
+        default: Callable[[str], str]
+        plugin = _plugin_func(key)
+        if plugin == "fmt_html":
+            default = self._fmt_html
+        elif plugin == "fmt_sql":
+            default = self._fmt_sql
+        else:
+            default = self._fmt_expr
+
+        formatted = self._try_plugins(code, plugin)
+        return formatted if formatted is not None else default(code)
+
+    def _reindent(self, code: str) -> str:
+        # the first line follows `key:`, so it is not considered by dedent
+        first, _, rest = code.strip().partition("\n")
+        lines = [first, *textwrap.dedent(rest).splitlines()]
+        indent = " " * INDENT_WIDTH * self.curr_indent
+        return "\n".join(indent + ln.rstrip() if ln.strip() else "" for ln in lines)
+
+    def fmt_dict(self, dict_: ParseTree) -> Fmt:
         with self.indent():
-            pairs = self.fmt(dict_.children)
+            pairs = yield dict_.children
 
         if pairs == "":
             return f"{self.fmt_indent()}{{}}"
@@ -165,13 +371,18 @@ class LkmlFormatter:
 
         return f"{lcomments}{self.fmt_indent()}{key}: {end}{tcomments}"
 
-    def fmt_lkml(self, lookml: ParseTree) -> str:
+    def fmt_lkml(self, lookml: ParseTree) -> Fmt:
         stmts = [child for child in lookml.children]
-        lkml = self.fmt(stmts)
+        return (yield self.fmt_stmts(stmts, self.comments.pop_all))
 
-        while 0 < len(self.comments):
+    def fmt_stmts(
+        self, stmts: list[ParseTree | Token], rest: Callable[[], list[Token]]
+    ) -> Fmt:
+        lkml = yield stmts
+
+        for comment in rest():
             # comments may have trailing space
-            lkml += f"\n{str(self.comments.pop(0).value).rstrip()}"
+            lkml += f"\n{str(comment.value).rstrip()}"
         lkml = lkml.lstrip()  # in the case of lkml == "\n#comment"
 
         # handle trailing comments
@@ -187,9 +398,61 @@ class LkmlFormatter:
 
         return "\n".join(lines) + "\n"
 
-    def fmt_named_dict(self, ndict: ParseTree) -> str:
-        name = self.fmt(ndict.children[0]).lstrip()
-        dict_ = self.fmt(ndict.children[1]).lstrip()
+    def fmt_range(self, ranges: list[tuple[int, int]]) -> str:
+        """Format top level pairs overlapping with ranges.
+
+        ranges are pairs of 1-based line numbers (both inclusive).
+        Lines which are not formatted are kept as they are.
+        """
+        lines = self.lkml.splitlines(keepends=True)
+        pieces: list[str] = []
+        done = 0  # lines[:done] are already appended to pieces
+
+        for region, start, end in self.regions():
+            if not any(s <= end and start <= e for s, e in ranges):
+                continue
+
+            pieces += lines[done : start - 1]
+            self.comments.pop_before(start)  # they are kept as they are
+            stmts = self.fmt_stmts(region, lambda: self.comments.pop_before(end + 1))
+            pieces.append(self._run(stmts))
+            done = end
+
+        pieces += lines[done:]
+        return "".join(pieces)
+
+    # regions are groups of top level pairs which do not share lines with others
+    def regions(self) -> list[tuple[list[ParseTree | Token], int, int]]:
+        regions: list[tuple[list[ParseTree | Token], int, int]] = []
+        for pair in self.tree.children:
+            start, end = self.lines_of(_tree(pair))
+            if 0 < len(regions) and start <= regions[-1][2]:
+                regions[-1][0].append(pair)
+                regions[-1] = (regions[-1][0], regions[-1][1], end)
+            else:
+                regions.append(([pair], start, end))
+        return regions
+
+    # unlike span, closing brackets are also taken into account
+    def lines_of(self, tree: ParseTree) -> tuple[int, int]:
+        tokens = [
+            c for t in tree.iter_subtrees() for c in t.children if isinstance(c, Token)
+        ]
+        first = min(tokens, key=lambda t: t.start_pos or 0)
+        last = max(tokens, key=lambda t: t.end_pos or 0)
+        if first.line is None or last.end_line is None or last.end_pos is None:
+            raise LkmlfmtException()
+
+        end_pos = last.end_pos
+        match = CLOSING.match(self.lkml, end_pos)
+        if match is not None and 0 <= match.end("closing"):
+            end_pos = match.end("closing")
+        end_line = last.end_line + self.lkml.count("\n", last.end_pos, end_pos)
+        return first.line, end_line
+
+    def fmt_named_dict(self, ndict: ParseTree) -> Fmt:
+        name = (yield ndict.children[0]).lstrip()
+        dict_ = (yield ndict.children[1]).lstrip()
         # NOTE
         # since this is a simple wrapper of fmt_dict
         # do not have to increment curr_indent
@@ -207,12 +470,12 @@ class LkmlFormatter:
 
         return lcomments + self.fmt_indent() + t + tcomments
 
-    def fmt_value_pair(self, pair: ParseTree) -> str:
+    def fmt_value_pair(self, pair: ParseTree) -> Fmt:
         lcomments = self.fmt_leading_comments_of(_token(pair.children[0]))
         tcomments = self.fmt_trailing_comments_of(_token(pair.children[0]))
 
-        key = self.fmt(pair.children[0]).lstrip()
-        value = self.fmt(pair.children[1]).lstrip()
+        key = (yield pair.children[0]).lstrip()
+        value = (yield pair.children[1]).lstrip()
 
         return f"{lcomments}{self.fmt_indent()}{key}:{tcomments} {value}"
 
@@ -226,32 +489,21 @@ class LkmlFormatter:
             self.curr_indent -= 1
 
     def get_leading_comments(self, token: Token) -> list[Token]:
-        comments = []
-        while (
-            0 < len(self.comments)
-            and token.line is not None
-            and self.comments[0].line is not None
-            and self.comments[0].line < token.line
-        ):
-            comments.append(self.comments.pop(0))
-        return comments
+        if token.line is None:
+            return []
+        return self.comments.pop_before(token.line)
 
-    # NOTE since looker doen't support inline comment, maybe len(result) == 1
+    # NOTE since looker doen't support inline comment, len(result) <= 1
     def get_trailing_comments(self, token: Token) -> list[Token]:
-        comments = []
-        idx = 0
-
-        while (
-            idx < len(self.comments)
-            and token.line is not None
-            and (line := self.comments[idx].line) is not None
-            and line <= token.line
-        ):
-            if line == token.line:
-                comments.append(self.comments.pop(idx))
-                continue
-            idx += 1  # if self.comments[idx] is leading comments
-        return comments
+        if token.line is None:
+            return []
+        return self.comments.pop_at(token.line)
+
+    # equivalent to counting blank lines in self.lkml.splitlines()[start:end]
+    def count_blank_lines(self, start: int, end: int) -> int:
+        last = len(self.blank_lines) - 1
+        start, end = min(start, last), min(end, last)
+        return max(0, self.blank_lines[end] - self.blank_lines[start])
 
     def fmt_indent(self) -> str:
         return " " * INDENT_WIDTH * self.curr_indent
@@ -272,12 +524,12 @@ class LkmlFormatter:
         comments = " ".join(map(lambda t: str(t.value).rstrip(), tokens))
         return COMMENT_MARKER + comments + COMMENT_MARKER
 
-    def fmt_trees(self, trees: list[Token | ParseTree], sep: str = "") -> str:
+    def fmt_trees(self, trees: list[Token | ParseTree], sep: str = "") -> Fmt:
         joined = ""
 
         for i, t in enumerate(trees):
             if i == 0:
-                joined += self.fmt(t)
+                joined += yield t
                 continue
 
             prev_line: int | None = None
@@ -285,27 +537,22 @@ class LkmlFormatter:
             if isinstance(t, Token):
                 next_line = t.line
             else:
-                next_line: int | None = t._position.line  # type: ignore
+                next_line: int | None = t.span.line  # type: ignore
 
             prev = trees[i - 1]
             if isinstance(prev, Token):
                 prev_line = prev.end_line
             else:
-                prev_line = prev._position.end_line  # type: ignore
+                prev_line = prev.span.end_line  # type: ignore
 
             joined += sep
             if prev_line is None or next_line is None:
-                joined += f"\n{self.fmt(t)}"
+                joined += "\n" + (yield t)
                 continue
 
-            for _ in filter(
-                lambda s: BLANK_LINE.match(s) is not None,
-                self.lkml.splitlines()[prev_line:next_line],
-            ):
-                joined += "\n"
-
+            joined += "\n" * self.count_blank_lines(prev_line, next_line)
             joined += "\n"
-            joined += self.fmt(t)
+            joined += yield t
 
         return joined
 
@@ -314,10 +561,24 @@ class LkmlFormatter:
         return " " * INDENT_WIDTH * self.curr_indent + html
 
     def _fmt_sql(self, liquid: str) -> str:
-        jinja, templates, dummies = template.to_jinja(liquid)
-        jinja = api.format_string(jinja, mode=self.mode).rstrip()
-        liquid = template.to_liquid(jinja, templates, dummies)
-        return liquid
+        # sqlfmt considers the indent when splitting lines
+        key = ("sql", self.dialect, self.curr_indent, liquid)
+        if (formatted := code_cache.get(key)) is not None:
+            return formatted
+
+        with stats.phase("to_jinja"):
+            jinja, templates, dummies = template.to_jinja(liquid)
+        with stats.phase("sqlfmt"):
+            # NOTE importing sqlfmt takes time, defer it until it is really needed
+            from lkmlfmt import sql
+
+            jinja = sql.format_string(
+                jinja, self.dialect, self.curr_indent, INDENT_WIDTH
+            ).rstrip()
+        with stats.phase("to_liquid"):
+            formatted = template.to_liquid(jinja, templates, dummies)
+        code_cache.set(key, formatted)
+        return formatted
 
     # NOTE let's rely on sqlfmt for not only sql but also looker expression!
     def _fmt_expr(self, liquid: str) -> str:
@@ -347,23 +608,162 @@ class LkmlFormatter:
         return expr
 
     def _try_plugins(self, code: str, func: str) -> str | None:
-        for p in self.plugins:
+        for p in map(_import_plugin, self.plugin_names):
             if not hasattr(p, func):
                 continue
+            key = (func, p.__name__, self.curr_indent, code)
+            if (s := code_cache.get(key)) is not None:
+                return s
+
             f = getattr(p, func)
-            s = f(code, self.curr_indent)
+            with stats.phase(f"{p.__name__}.{func}"):
+                s = f(code, self.curr_indent)
             if not isinstance(s, str):
                 raise LkmlfmtException()
+            code_cache.set(key, s)
             return s
         return None
 
 
+# plugins are imported once per process
+@cache
+def _import_plugin(name: str) -> ModuleType:
+    return importlib.import_module(name)
+
+
+def _plugin_func(key: str) -> str:
+    """Name of the plugin function which formats the code block of key."""
+    if key.startswith("html"):
+        return "fmt_html"
+    if key.startswith("sql"):
+        return "fmt_sql"
+    return "fmt_expr"
+
+
+def _code_blocks(tree: ParseTree, indent: int) -> Iterator[Block]:
+    """Code blocks in the order of appearance.
+
+    indent is the same as curr_indent of LkmlFormatter when tree is formatted.
+    """
+    stack = [(tree, indent)]
+    while 0 < len(stack):
+        t, indent = stack.pop()
+        if t.data == "code_pair":
+            if len(t.children) == 3:
+                key = _token(t.children[0])
+                yield str(key), str(t.children[1]), indent + 1, key.line or 0
+            continue
+
+        if t.data in ("arr", "dict"):
+            indent += 1
+        stack += [(c, indent) for c in reversed(t.children) if isinstance(c, Tree)]
+
+
+def _fmt_blocks(
+    blocks: list[Block],
+    clickhouse: bool,
+    plugins: list[str],
+    budget: Budget | None,
+    deadline: float | None,
+    path: str,
+) -> tuple[list[str], bool]:
+    """Formatted blocks and whether some of them are only re-indented."""
+    # the formatter of empty LookML is used only to format code blocks
+    formatter = LkmlFormatter("", clickhouse, plugins, budget)
+    # NOTE
+    # the deadline of the file is shared with the parent process.
+    # time.monotonic is system-wide on Linux (CLOCK_MONOTONIC),
+    # so it can be compared across processes.
+    formatter.deadline = deadline
+    formatted = []
+    with location(path):
+        for key, code, indent, line in blocks:
+            formatter.curr_indent = indent
+            formatted.append(formatter.fmt_code(key, code, line))
+    return formatted, formatter.degraded
+
+
 def _token(token: Token | ParseTree) -> Token:
     if isinstance(token, Token):
         return token
     raise LkmlfmtException()
 
 
-def fmt(lkml: str, clickhouse: bool = False, plugins: list[str] = []) -> str:
-    formatter = LkmlFormatter(lkml, clickhouse, plugins)
+def _tree(tree: Token | ParseTree) -> ParseTree:
+    if isinstance(tree, Tree):
+        return tree
+    raise LkmlfmtException()
+
+
+def fmt(
+    lkml: str,
+    clickhouse: bool = False,
+    plugins: list[str] = [],
+    budget: Budget | None = None,
+    executor: "Executor | None" = None,
+) -> str:
+    """Format LookML.
+
+    If executor is given, code blocks are formatted in parallel in advance.
+    ProcessPoolExecutor is recommended because sqlfmt is written in pure python.
+    """
+    formatter = LkmlFormatter(lkml, clickhouse, plugins, budget)
+    if executor is not None:
+        formatter.prefill(executor)
     return formatter.fmt()
+
+
+def fmt_range(
+    lkml: str,
+    ranges: list[tuple[int, int]],
+    clickhouse: bool = False,
+    plugins: list[str] = [],
+    budget: Budget | None = None,
+) -> str:
+    formatter = LkmlFormatter(lkml, clickhouse, plugins, budget)
+    return formatter.fmt_range(ranges)
+
+
+def fmt_many(
+    lkmls: Iterable[str],
+    clickhouse: bool = False,
+    plugins: list[str] = [],
+    executor: "Executor | None" = None,
+    chunksize: int = CHUNKSIZE,
+) -> Iterator[str]:
+    """Format LookML strings and yield the results in input order.
+
+    Plugins and formatted code blocks are shared by all inputs in a process.
+    If executor is given, chunks of inputs are formatted in parallel.
+    ProcessPoolExecutor is recommended because sqlfmt is written in pure python.
+    In that case, syntax errors are raised as LkmlfmtException.
+    """
+    if executor is None:
+        for lkml in lkmls:
+            yield fmt(lkml, clickhouse, plugins)
+        return
+
+    func = partial(_fmt_chunk, clickhouse=clickhouse, plugins=plugins)
+    it = iter(lkmls)
+    # NOTE
+    # unlike Executor.map(), inputs are consumed lazily
+    # so that the number of pending chunks is bounded
+    pending: deque[Future[list[str]]] = deque()
+    while True:
+        while len(pending) < MAX_PENDING_CHUNKS:
+            chunk = list(islice(it, chunksize))
+            if len(chunk) == 0:
+                break
+            pending.append(executor.submit(func, chunk))
+
+        if len(pending) == 0:
+            return
+        yield from pending.popleft().result()
+
+
+def _fmt_chunk(lkmls: list[str], clickhouse: bool, plugins: list[str]) -> list[str]:
+    try:
+        return [fmt(lkml, clickhouse, plugins) for lkml in lkmls]
+    except UnexpectedInput as e:
+        # lark exceptions cannot be pickled to be sent from worker processes
+        raise LkmlfmtException(str(e)) from None
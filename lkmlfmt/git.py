@@ -0,0 +1,31 @@
+import subprocess
+from pathlib import Path
+
+from lkmlfmt.exception import LkmlfmtException
+
+
+def changed_files(ref: str, cwd: Path | None = None) -> list[Path]:
+    """Files which are added or modified since the merge base of ref and HEAD.
+
+    Uncommitted changes and untracked files are also included.
+    """
+    root = Path(_git(["rev-parse", "--show-toplevel"], cwd).rstrip("\n"))
+    # paths are relative to the root of the repository
+    diff = _git(
+        ["diff", "--name-only", "-z", "--diff-filter=d", "--merge-base", ref], cwd
+    )
+    untracked = _git(
+        ["ls-files", "--others", "--exclude-standard", "--full-name", "-z"], cwd
+    )
+    return [root / p for p in (diff + untracked).split("\0") if p != ""]
+
+
+def _git(args: list[str], cwd: Path | None) -> str:
+    try:
+        res = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+    except FileNotFoundError as e:
+        raise LkmlfmtException("git is not installed") from e
+
+    if res.returncode != 0:
+        raise LkmlfmtException(res.stderr.strip())
+    return res.stdout
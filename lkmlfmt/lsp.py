@@ -0,0 +1,209 @@
+import json
+from typing import IO, Any
+
+from lkmlfmt.exception import LkmlfmtException
+from lkmlfmt.formatter import fmt, fmt_range
+from lkmlfmt.logger import logger
+
+# NOTE
+# minimal language server over stdio.
+# only full document synchronization is supported.
+# https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/
+TEXT_DOCUMENT_SYNC_FULL = 1
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+REQUEST_FAILED = -32803
+
+Ranges = tuple[tuple[int, int], ...] | None
+
+
+class Document:
+    """Text of an open document and its formatted versions.
+
+    Formatted versions are discarded when the text is changed.
+    Code blocks are also memoized by lkmlfmt.cache.code_cache,
+    so unchanged blocks are not formatted again after the text is changed.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.formatted: dict[Ranges, str] = {}
+
+    def update(self, text: str) -> None:
+        if text != self.text:
+            self.text = text
+            self.formatted.clear()
+
+    def fmt(self, clickhouse: bool, plugins: list[str], ranges: Ranges = None) -> str:
+        formatted = self.formatted.get(ranges)
+        if formatted is None:
+            if ranges is None:
+                formatted = fmt(self.text, clickhouse, plugins)
+            else:
+                formatted = fmt_range(self.text, list(ranges), clickhouse, plugins)
+            self.formatted[ranges] = formatted
+        return formatted
+
+
+class Server:
+    def __init__(
+        self,
+        rfile: IO[bytes],
+        wfile: IO[bytes],
+        clickhouse: bool = False,
+        plugins: list[str] = [],
+    ) -> None:
+        self.rfile = rfile
+        self.wfile = wfile
+        self.clickhouse = clickhouse
+        self.plugins = plugins
+        self.documents: dict[str, Document] = {}
+        self.shutdown = False
+
+    def serve(self) -> int:
+        """Handle messages until exit. Return the exit code."""
+        while True:
+            try:
+                msg = self.read()
+            except LkmlfmtException as e:
+                # NOTE
+                # the id of the message is unknown, the response is null
+                logger.warning(str(e))
+                self.error(None, PARSE_ERROR, str(e))
+                continue
+            if msg is None:
+                return 1  # the client died
+            if not isinstance(msg, dict):
+                self.error(None, INVALID_REQUEST, "message is not an object")
+                continue
+
+            if msg.get("method") == "exit":
+                return 0 if self.shutdown else 1
+            try:
+                self.handle(msg)
+            except (LookupError, TypeError, AttributeError) as e:
+                # NOTE
+                # malformed params (or a change of a document which is not open)
+                # must not kill the server
+                error = (
+                    f"invalid params of {msg.get('method')}: {type(e).__name__}: {e}"
+                )
+                if "id" in msg:
+                    self.error(msg["id"], INVALID_PARAMS, error)
+                else:
+                    logger.warning(error)
+
+    def handle(self, msg: dict[str, Any]) -> None:
+        method, params = msg.get("method"), msg.get("params") or {}
+        if "id" not in msg:  # notification
+            self.notify(method, params)
+            return
+
+        if self.shutdown:
+            self.error(msg["id"], INVALID_REQUEST, "server is shut down")
+            return
+
+        match method:
+            case "initialize":
+                self.respond(
+                    msg["id"],
+                    {
+                        "capabilities": {
+                            "textDocumentSync": TEXT_DOCUMENT_SYNC_FULL,
+                            "documentFormattingProvider": True,
+                            "documentRangeFormattingProvider": True,
+                        },
+                        "serverInfo": {"name": "lkmlfmt"},
+                    },
+                )
+            case "shutdown":
+                self.shutdown = True
+                self.respond(msg["id"], None)
+            case "textDocument/formatting":
+                self.fmt(msg["id"], params, None)
+            case "textDocument/rangeFormatting":
+                start, end = params["range"]["start"], params["range"]["end"]
+                # 0-based and exclusive -> 1-based and inclusive
+                last = end["line"] if end["character"] == 0 else end["line"] + 1
+                self.fmt(msg["id"], params, ((start["line"] + 1, last),))
+            case _:
+                self.error(msg["id"], METHOD_NOT_FOUND, f"unknown method: {method}")
+
+    def notify(self, method: str | None, params: dict[str, Any]) -> None:
+        match method:
+            case "textDocument/didOpen":
+                doc = params["textDocument"]
+                self.documents[doc["uri"]] = Document(doc["text"])
+            case "textDocument/didChange":
+                doc = self.documents[params["textDocument"]["uri"]]
+                # the last change contains the whole text
+                doc.update(params["contentChanges"][-1]["text"])
+            case "textDocument/didClose":
+                self.documents.pop(params["textDocument"]["uri"], None)
+            case _:
+                pass
+
+    def fmt(self, id: int | str, params: dict[str, Any], ranges: Ranges) -> None:
+        uri = params["textDocument"]["uri"]
+        doc = self.documents.get(uri)
+        if doc is None or not uri.endswith(".lkml"):
+            self.respond(id, None)
+            return
+
+        try:
+            formatted = doc.fmt(self.clickhouse, self.plugins, ranges)
+        except Exception as e:
+            logger.warning(f"failed to format {uri}: {e}")
+            self.error(id, REQUEST_FAILED, f"{type(e).__name__}: {e}")
+            return
+
+        if formatted == doc.text:
+            self.respond(id, [])
+            return
+
+        lines = doc.text.split("\n")
+        end = {"line": len(lines) - 1, "character": _utf16_len(lines[-1])}
+        edit = {"range": {"start": {"line": 0, "character": 0}, "end": end}}
+        self.respond(id, [{**edit, "newText": formatted}])
+
+    def respond(self, id: int | str, result: Any) -> None:
+        self.write({"jsonrpc": "2.0", "id": id, "result": result})
+
+    def error(self, id: int | str | None, code: int, message: str) -> None:
+        error = {"code": code, "message": message}
+        self.write({"jsonrpc": "2.0", "id": id, "error": error})
+
+    def read(self) -> Any:
+        """Read a message. Return None at the end of the input.
+
+        LkmlfmtException is raised if the message cannot be parsed.
+        """
+        headers = {}
+        while (line := self.rfile.readline()) not in (b"\r\n", b"\n"):
+            if line == b"":
+                return None
+            name, _, value = line.decode("ascii", "replace").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "content-length" not in headers:
+            raise LkmlfmtException("Content-Length header is missing")
+        length = headers["content-length"]
+        if not (length.isascii() and length.isdigit()):
+            raise LkmlfmtException(f"Content-Length is not a number: {length}")
+        body = self.rfile.read(int(length))
+        try:
+            return json.loads(body)
+        except ValueError as e:  # including UnicodeDecodeError
+            raise LkmlfmtException(f"message is not JSON: {e}") from None
+
+    def write(self, msg: dict[str, Any]) -> None:
+        body = json.dumps(msg).encode()
+        self.wfile.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        self.wfile.flush()
+
+
+def _utf16_len(text: str) -> int:
+    # positions are counted in UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
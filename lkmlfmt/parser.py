@@ -1,81 +1,107 @@
+import sys
+from collections.abc import Iterable
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Self
+from typing import NamedTuple
 
-from lark import Lark, ParseTree, Token, Tree, Visitor
+import lark
+from lark import Lark, ParseTree, Token, Tree
+from lark.tree import Meta
 
-DIR = Path(__file__).parent
-ParseTreeVisitor = Visitor[Token]
+from lkmlfmt import stats
 
-comments: list[Token] = []
+DIR = Path(__file__).parent
+GRAMMAR = DIR / "lkml.lark"
+# serialized parse tables generated by build_tables() at build time.
+# lark verifies the content, but the tables depend on the versions of lark and python
+# so the name prevents them from being overwritten in other environments
+TABLES = DIR / "lkml-lark{}-py{}{}.cache".format(lark.__version__, *sys.version_info)
 
-lkml_parser = Lark(
-    (DIR / "lkml.lark").read_text(),
-    start="lkml",
-    # https://lark-parser.readthedocs.io/en/latest/json_tutorial.html#step-2-lalr-1
-    parser="lalr",
-    lexer_callbacks={"COMMENT": comments.append},
-)
+# each call of parse() has its own list (contextvars are thread local)
+_comments: ContextVar[list[Token] | None] = ContextVar("comments", default=None)
 
 
-class Position:
+class Span(NamedTuple):
     line: int | None
     column: int | None
     end_line: int | None
     end_column: int | None
 
-    def __init__(self) -> None:
-        self.line = None
-        self.column = None
-        self.end_line = None
-        self.end_column = None
-
-    def extend(self, pos: Self | Token) -> None:
-        if (
-            pos.line is None
-            or pos.column is None
-            or pos.end_line is None
-            or pos.end_column is None
-        ):
-            return
-
-        if (
-            self.line is None
-            or self.column is None
-            or self.end_line is None
-            or self.end_column is None
-        ):
-            self.line = pos.line
-            self.column = pos.column
-            self.end_line = pos.end_line
-            self.end_column = pos.end_column
-            return
-
-        if pos.line < self.line or (pos.line == self.line and pos.column < self.column):
-            self.line = pos.line
-            self.column = pos.column
-        elif self.line < pos.line or (
-            self.line == pos.line and self.column < pos.column
-        ):
-            self.end_line = pos.end_line
-            self.end_column = pos.end_column
-
-
-class PositionSetter(ParseTreeVisitor):
-    def __default__(self, tree: ParseTree) -> None:
-        pos = Position()
-        for child in tree.children:
-            if isinstance(child, Tree):
-                pos.extend(child._position)  # type: ignore
-            elif child is not None:  # Token is sometimes None...
-                pos.extend(child)
-        tree._position = pos  # type: ignore
-
-
-# NOTE don't execute this function asynchronously
-def parse(lkml: str, set_position: bool = False) -> tuple[ParseTree, list[Token]]:
-    comments.clear()
-    tree = lkml_parser.parse(lkml)
-
-    if set_position:
-        PositionSetter().visit(tree)
+
+NO_SPAN = Span(None, None, None, None)
+
+
+# NOTE
+# lark builds a tree after its children,
+# so the span is computed while parsing instead of walking the tree afterwards.
+# lark.Tree instances have __dict__ anyway, so __slots__ would not save memory
+class SpanTree(Tree[Token]):
+    """Tree which knows the span of its children in the source."""
+
+    span: Span
+
+    def __init__(
+        self, data: str, children: list[Token | Tree[Token]], meta: Meta | None = None
+    ) -> None:
+        super().__init__(data, children, meta)
+        # children are in the order of appearance
+        start = _first(children)
+        end = _first(reversed(children))
+        if start is None or end is None:
+            self.span = NO_SPAN
+        else:
+            self.span = Span(start.line, start.column, end.end_line, end.end_column)
+
+
+def _first(children: Iterable[Token | Tree[Token]]) -> Span | Token | None:
+    for child in children:
+        if isinstance(child, SpanTree):
+            if child.span.line is not None:  # e.g. empty dict
+                return child.span
+        elif isinstance(child, Token):  # Token is sometimes None...
+            return child
+    return None
+
+
+def _collect_comment(comment: Token) -> None:
+    comments = _comments.get()
+    if comments is not None:
+        comments.append(comment)
+
+
+def _lark(cache: str | bool) -> Lark:
+    return Lark(
+        GRAMMAR.read_text(),
+        start="lkml",
+        # https://lark-parser.readthedocs.io/en/latest/json_tutorial.html#step-2-lalr-1
+        parser="lalr",
+        lexer_callbacks={"COMMENT": _collect_comment},
+        tree_class=SpanTree,
+        # https://lark-parser.readthedocs.io/en/latest/classes.html#lark.Lark.__init__
+        cache=cache,
+    )
+
+
+def build_tables() -> None:
+    """Generate the parse tables to be shipped with the package."""
+    TABLES.unlink(missing_ok=True)
+    _lark(str(TABLES))
+
+
+# parse tables are shared by all threads.
+# NOTE
+# if they are not shipped (e.g. git checkout), they are built in-process.
+# lark's default cache is a pickle in the shared temporary directory
+# whose name is predictable, so another user could plant it
+lkml_parser = _lark(str(TABLES) if TABLES.exists() else False)
+
+
+def parse(lkml: str) -> tuple[ParseTree, list[Token]]:
+    comments: list[Token] = []
+    token = _comments.set(comments)
+    try:
+        with stats.phase("parse"):
+            tree = lkml_parser.parse(lkml)
+    finally:
+        _comments.reset(token)
     return tree, comments
@@ -0,0 +1,46 @@
+from contextvars import ContextVar
+from functools import cache
+from typing import Any
+
+from sqlfmt import api
+from sqlfmt.line import Line
+
+# (indent, indent_width) of the code block being formatted by lkmlfmt
+_indent: ContextVar[tuple[int, int] | None] = ContextVar("indent", default=None)
+_prefix: Any = vars(Line)["prefix"]
+
+
+def _indented_prefix(line: Line) -> str:
+    indent = _indent.get()
+    if indent is None:  # called by someone else
+        return str(_prefix.fget(line))
+    return " " * indent[1] * (line.depth[0] + line.depth[1] + indent[0])
+
+
+# NOTE
+# the property is replaced only once, when this module is imported.
+# it behaves as before unless called via format_string()
+# https://docs.python.org/3/library/functions.html#property
+Line.prefix = property(_indented_prefix)  # type: ignore
+
+
+def format_string(sql: str, dialect: str, indent: int, indent_width: int) -> str:
+    """Format sql as if it was nested in the indent level of LookML."""
+    token = _indent.set((indent, indent_width))
+    try:
+        return api.format_string(sql, mode=_mode(dialect))
+    finally:
+        _indent.reset(token)
+
+
+@cache
+def _mode(dialect: str) -> api.Mode:
+    return api.Mode(dialect_name=dialect)
+
+
+# NOTE
+# the first call of sqlfmt takes much longer than the others
+# (e.g. regular expressions are compiled), so it can be done in advance
+@cache
+def warm_up(dialect: str) -> None:
+    format_string("select 1", dialect, 0, 2)
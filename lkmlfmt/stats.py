@@ -0,0 +1,113 @@
+import heapq
+import time
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any
+
+MAX_BLOCKS = 20
+
+# NOTE
+# instrumentation is enabled only inside collect().
+# otherwise phase(), block() and file() return a shared no-op context manager
+_current: ContextVar["Stats | None"] = ContextVar("stats", default=None)
+_NULL: AbstractContextManager[None] = nullcontext()
+
+
+class Stats:
+    """Wall time and call counts of each phase, file and code block.
+
+    Stats are picklable so that workers can send them to the main process.
+    """
+
+    def __init__(self, max_blocks: int = MAX_BLOCKS) -> None:
+        self.max_blocks = max_blocks
+        self.seconds: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        self.files: list[tuple[float, str]] = []
+        # min heap of (seconds, path, line, key) to keep the slowest blocks
+        self.blocks: list[tuple[float, str, int, str]] = []
+        self.path = ""
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, time.perf_counter() - start)
+
+    @contextmanager
+    def block(self, key: str, line: int) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._push((time.perf_counter() - start, self.path, line, key))
+
+    @contextmanager
+    def file(self, path: str) -> Iterator[None]:
+        self.path = path
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.files.append((time.perf_counter() - start, path))
+            self.path = ""
+
+    def merge(self, other: "Stats") -> None:
+        for name, seconds in other.seconds.items():
+            self._add(name, seconds, other.calls[name])
+        self.files += other.files
+        for block in other.blocks:
+            self._push(block)
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "phases": {
+                name: {"seconds": seconds, "calls": self.calls[name]}
+                for name, seconds in sorted(self.seconds.items())
+            },
+            "files": [
+                {"path": path, "seconds": seconds}
+                for seconds, path in sorted(self.files, reverse=True)
+            ],
+            "slowest_blocks": [
+                {"path": path, "line": line, "key": key, "seconds": seconds}
+                for seconds, path, line, key in sorted(self.blocks, reverse=True)
+            ],
+        }
+
+    def _add(self, name: str, seconds: float, calls: int = 1) -> None:
+        self.seconds[name] = self.seconds.get(name, 0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def _push(self, block: tuple[float, str, int, str]) -> None:
+        if len(self.blocks) < self.max_blocks:
+            heapq.heappush(self.blocks, block)
+        else:
+            heapq.heappushpop(self.blocks, block)
+
+
+@contextmanager
+def collect(stats: Stats) -> Iterator[Stats]:
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def phase(name: str) -> AbstractContextManager[None]:
+    stats = _current.get()
+    return _NULL if stats is None else stats.phase(name)
+
+
+def block(key: str, line: int) -> AbstractContextManager[None]:
+    stats = _current.get()
+    return _NULL if stats is None else stats.block(key, line)
+
+
+def file(path: str) -> AbstractContextManager[None]:
+    stats = _current.get()
+    return _NULL if stats is None else stats.file(path)
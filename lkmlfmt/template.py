@@ -1,6 +1,7 @@
 import re
 
 LIQUID_MARKER = "{{% set LKMLFMT_MARKER = {} %}}"
+MARKER = re.compile(r"\{% set LKMLFMT_MARKER = (?P<id>\d+) %\}")
 TEMPLATE = re.compile(
     r"""(?P<tag>\{%-?\s*(?P<type>#|([a-z_]*))([^"'}]*|'[^']*?'|"[^"]*?")*?-?%\})"""
     + r"""|(?P<obj>\{\{([^"'}]*|'[^']*?'|"[^"]*?")*?\}\})"""
@@ -10,23 +11,16 @@ DUMMY = re.compile(r"^(?P<lead_n> *?\n)?(?P<indent> *)")
 
 
 def to_jinja(liquid: str) -> tuple[str, list[str], list[str]]:
-    jinja = ""
-    templates = []
-    dummies = []
-    id_ = 0
+    pieces: list[str] = []
+    templates: list[str] = []
+    dummies: list[str] = []
+    pos = 0  # the end of the last replaced template
     skip_to: str | None = None
 
-    while True:
-        match = TEMPLATE.search(liquid)
-        if match is None:
-            jinja += liquid
-            break
-
+    for match in TEMPLATE.finditer(liquid):
         type_ = match.group("type")
         if skip_to is not None and skip_to != type_:
-            jinja += liquid[: match.end()]
-            liquid = liquid[match.end() :]
-            continue
+            continue  # appended as it is with the next replaced template
 
         skip_to = None
         match type_:
@@ -100,29 +94,47 @@ def to_jinja(liquid: str) -> tuple[str, list[str], list[str]]:
                 dummy = f"{{% {type_} %}}"
 
         # append results
-        marker = LIQUID_MARKER.format(id_)
-        jinja += f"{liquid[: match.start()]}{marker}{dummy}"
+        marker = LIQUID_MARKER.format(len(templates))
+        pieces += [liquid[pos : match.start()], marker, dummy]
 
         templates.append(match.group(0))
         dummies.append(dummy)
+        pos = match.end()
 
-        # prepare for next iteration
-        liquid = liquid[match.end() :]
-        id_ += 1
-
-    return jinja, templates, dummies
+    pieces.append(liquid[pos:])
+    return "".join(pieces), templates, dummies
 
 
 def to_liquid(jinja: str, templates: list[str], dummies: list[str]) -> str:
-    for i in range(len(templates)):
-        leading, trailing, *_ = jinja.split(LIQUID_MARKER.format(i))
-        space, *_ = trailing.split(dummies[i])
+    pieces: list[str] = []
+    pos = 0  # the end of the last restored dummy
+
+    for match in MARKER.finditer(jinja):
+        i = int(match.group("id"))
+        pieces.append(jinja[pos : match.start()])
+        pos = match.end()
+
+        end = jinja.find(dummies[i], pos)
+        if end < 0:  # sqlfmt never drops the dummy but just in case
+            continue
+
+        space = jinja[pos:end]
         if "\n" in space:
-            leading = leading.rstrip("\n ")
+            _rstrip(pieces, "\n ")
         else:
-            trailing = trailing.lstrip(" ")
+            space = space.lstrip(" ")
+
+        pieces += [space, templates[i]]
+        pos = end + len(dummies[i])
+
+    pieces.append(jinja[pos:])
+    return "".join(pieces)
 
-        trailing = trailing.replace(dummies[i], templates[i], 1)
-        jinja = leading + trailing
 
-    return jinja
+def _rstrip(pieces: list[str], chars: str) -> None:
+    """Equivalent to "".join(pieces).rstrip(chars) but in place."""
+    while 0 < len(pieces):
+        pieces[-1] = pieces[-1].rstrip(chars)
+        if pieces[-1] != "":
+            return
+        pieces.pop()
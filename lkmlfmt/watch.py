@@ -0,0 +1,98 @@
+import hashlib
+import os
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+INTERVAL = 0.2
+DEBOUNCE = 0.5
+
+
+class Watcher:
+    """Poll files and report the modified ones in batches.
+
+    Changes are collected until no file is changed for `debounce` seconds
+    (e.g. during `git checkout`), then reported at once.
+    Files whose contents are the same as before (e.g. `touch`) are not reported.
+    """
+
+    def __init__(
+        self,
+        select: Callable[[], list[Path]],
+        interval: float = INTERVAL,
+        debounce: float = DEBOUNCE,
+    ) -> None:
+        self.select = select
+        self.interval = interval
+        self.debounce = debounce
+        self.stats: dict[Path, tuple[int, int]] = {}
+        self.hashes: dict[Path, str] = {}
+        self.pending: set[Path] = set()
+        self.last_change = 0.0
+
+        for path in self.poll():
+            self.record(path)
+
+    def batches(self) -> Iterator[list[Path]]:
+        while True:
+            batch = self.step(time.monotonic())
+            if 0 < len(batch):
+                yield batch
+            else:
+                time.sleep(self.interval)
+
+    def step(self, now: float) -> list[Path]:
+        if 0 < len(changed := self.poll()):
+            self.pending |= changed
+            self.last_change = now
+            return []
+
+        if len(self.pending) == 0 or now - self.last_change < self.debounce:
+            return []
+
+        batch = [path for path in sorted(self.pending) if self.modified(path)]
+        self.pending.clear()
+        return batch
+
+    def poll(self) -> set[Path]:
+        """Paths which are created or whose mtime or size is changed."""
+        stats = {}
+        for path in self.select():
+            try:
+                stats[path] = _stat(path)
+            except FileNotFoundError:  # removed after listed
+                pass
+
+        changed = {p for p, s in stats.items() if self.stats.get(p) != s}
+        for path in self.stats.keys() - stats.keys():  # removed
+            self.hashes.pop(path, None)
+            self.pending.discard(path)
+        self.stats = stats
+        return changed
+
+    def modified(self, path: Path) -> bool:
+        try:
+            digest = _digest(path)
+        except FileNotFoundError:
+            return False
+        if self.hashes.get(path) == digest:
+            return False
+        self.hashes[path] = digest
+        return True
+
+    def record(self, path: Path) -> None:
+        """Remember the current state of path, e.g. after it is formatted."""
+        try:
+            self.stats[path] = _stat(path)
+            self.hashes[path] = _digest(path)
+        except FileNotFoundError:
+            pass
+
+
+def _stat(path: Path) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
@@ -0,0 +1,12 @@
+"""Plugin which uppercases sql and sleeps for `sleep(SECONDS)` in it."""
+
+import re
+import time
+
+SLEEP = re.compile(r"sleep\((?P<seconds>[\d.]+)\)")
+
+
+def fmt_sql(sql: str, indent: int) -> str:
+    for m in SLEEP.finditer(sql):
+        time.sleep(float(m.group("seconds")))
+    return " " * 2 * indent + sql.strip().upper()
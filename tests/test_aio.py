@@ -0,0 +1,61 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+import lkmlfmt
+from lkmlfmt import formatter
+from lkmlfmt.exception import LkmlfmtException
+
+INPUTS = [f"sql: select {i}, {i % 7} from t ;;" for i in range(40)]
+
+
+def test_afmt() -> None:
+    async def main() -> list[str]:
+        semaphore = asyncio.Semaphore(2)
+        coros = [lkmlfmt.afmt(lkml, semaphore=semaphore) for lkml in INPUTS]
+        return await asyncio.gather(*coros)
+
+    assert asyncio.run(main()) == [lkmlfmt.fmt(lkml) for lkml in INPUTS]
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_afmt_many(executor: str) -> None:
+    async def main(ex: ThreadPoolExecutor | ProcessPoolExecutor) -> list[str]:
+        return [lkml async for lkml in lkmlfmt.afmt_many(INPUTS, executor=ex)]
+
+    cls = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+    with cls(max_workers=2) as ex:
+        assert asyncio.run(main(ex)) == [lkmlfmt.fmt(lkml) for lkml in INPUTS]
+
+        with pytest.raises(LkmlfmtException, match="Unexpected token"):
+            asyncio.run(lkmlfmt.afmt("key: {", executor=ex))
+
+
+def test_cancel(monkeypatch: pytest.MonkeyPatch) -> None:
+    started = []
+    release = threading.Event()
+
+    def fmt(lkml: str, clickhouse: bool, plugins: list[str]) -> str:
+        started.append(lkml)
+        release.wait()
+        return lkml
+
+    monkeypatch.setattr(formatter, "fmt", fmt)
+
+    async def main(ex: ThreadPoolExecutor) -> None:
+        it = lkmlfmt.afmt_many(INPUTS, executor=ex, limit=4)
+        task = asyncio.ensure_future(anext(it))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        try:
+            asyncio.run(main(ex))
+        finally:
+            release.set()
+    # at most `limit` strings are submitted and the rest are cancelled
+    assert started == INPUTS[:1]
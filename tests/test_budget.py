@@ -0,0 +1,115 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from lkmlfmt.budget import Budget, location
+from lkmlfmt.cache import DiskCache, code_cache
+from lkmlfmt.formatter import _fmt_blocks, fmt
+
+PLUGINS = ["tests.slow_plugin"]
+LKML = """\
+view: v {
+  dimension: a { sql: select 1 ;; }
+  dimension: b {
+    sql: select sleep(SECONDS)
+        from t
+          where x
+    ;;
+  }
+}
+"""
+FORMATTED = """\
+view: v {
+  dimension: a {
+    sql: SELECT 1 ;;
+  }
+  dimension: b {
+    sql:
+      select sleep(SECONDS)
+      from t
+        where x
+    ;;
+  }
+}
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_code_cache() -> None:
+    code_cache.clear()  # formatted blocks should not be reused
+
+
+def test_block_timeout(caplog: pytest.LogCaptureFixture) -> None:
+    lkml = LKML.replace("SECONDS", "10")
+    start = time.monotonic()
+    with location("v.view.lkml"):
+        assert fmt(lkml, plugins=PLUGINS, budget=Budget(block=0.2)) == (
+            FORMATTED.replace("SECONDS", "10")
+        )
+    assert time.monotonic() - start < 2  # interrupted
+    assert "v.view.lkml:4: sql is not formatted in 0.2s" in caplog.text
+
+
+def test_block_timeout_thread() -> None:
+    # the block cannot be interrupted, but the result is discarded
+    lkml = LKML.replace("SECONDS", "0.3")
+    budget = Budget(block=0.2)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fmt, lkml, plugins=PLUGINS, budget=budget)
+        assert future.result() == FORMATTED.replace("SECONDS", "0.3")
+
+
+def test_file_timeout(caplog: pytest.LogCaptureFixture) -> None:
+    lkml = "sql: select sleep(0.3) ;;\nsql: select sleep(0.31) ;;\nsql: select 1 ;;"
+    assert fmt(lkml, plugins=PLUGINS, budget=Budget(file=0.45)) == (
+        "sql: SELECT SLEEP(0.3) ;;\nsql: select sleep(0.31) ;;\nsql: select 1 ;;\n"
+    )
+    assert "<string>:2: sql is not formatted in" in caplog.text
+    assert "<string>:3: sql is not formatted because the file is out of time" in (
+        caplog.text
+    )
+
+
+def test_skip(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    lkml = LKML.replace("SECONDS", "10")
+    budget = Budget(block=0.2, skip=DiskCache(tmp_path))
+    fmt(lkml, plugins=PLUGINS, budget=budget)
+
+    start = time.monotonic()
+    assert fmt(lkml, plugins=PLUGINS, budget=budget) == (
+        FORMATTED.replace("SECONDS", "10")
+    )
+    assert time.monotonic() - start < 0.2  # not even tried
+    assert "sql is known to be slow" in caplog.text
+
+    # interrupted because of the file budget
+    budget = Budget(block=1, file=0.2, skip=DiskCache(tmp_path / "file"))
+    fmt(lkml, plugins=PLUGINS, budget=budget)
+    assert not (tmp_path / "file").exists()
+
+
+def test_block_timeout_prefill() -> None:
+    lkml = "sql: select sleep(10) ;;\nsql: select 1 ;;"
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert fmt(
+            lkml, plugins=PLUGINS, budget=Budget(block=0.5), executor=executor
+        ) == ("sql: select sleep(10) ;;\nsql: SELECT 1 ;;\n")
+    assert time.monotonic() - start < 5  # interrupted in the worker
+
+
+def test_fmt_blocks_deadline() -> None:
+    # the deadline of the file is not restarted in workers
+    blocks = [("sql", "select 1", 0, 1)]
+    budget = Budget(file=10)
+    deadline = time.monotonic()
+    assert _fmt_blocks(blocks, False, PLUGINS, budget, deadline, "<string>") == (
+        ["select 1"],
+        True,
+    )
+    assert _fmt_blocks(blocks, False, PLUGINS, budget, None, "<string>") == (
+        ["SELECT 1"],
+        False,
+    )
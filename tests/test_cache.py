@@ -0,0 +1,77 @@
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from lkmlfmt.cache import CodeCache, CodeKey, DiskCache, code_cache
+from lkmlfmt.formatter import fmt
+
+
+def test_disk_cache(tmp_path: Path) -> None:
+    cache = DiskCache(tmp_path / "cache", salt="salt")
+    assert cache.get("key") is None
+
+    cache.set("key", "value\r\n")
+    assert cache.get("key") == "value\r\n"
+    assert DiskCache(tmp_path / "cache", salt="other").get("key") is None
+
+
+def test_disk_cache_prune(tmp_path: Path) -> None:
+    cache = DiskCache(tmp_path, max_entries=2)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set(key, key)
+        os.utime(cache._path(key), (i, i))
+    cache.get("a")  # "b" becomes the least recently used entry
+
+    cache.prune()
+    assert cache.get("a") == "a"
+    assert cache.get("b") is None
+    assert cache.get("c") == "c"
+
+
+def test_code_cache(tmp_path: Path) -> None:
+    cache = CodeCache(maxsize=2, disk=DiskCache(tmp_path))
+    cache.set(("sql", 0, "a"), "A")
+    cache.set(("sql", 0, "b"), "B")
+    assert cache.get(("sql", 0, "a")) == "A"
+    cache.set(("sql", 0, "c"), "C")  # ("sql", 0, "b") is evicted from memory
+    assert len(cache) == 2
+    assert (cache.hits, cache.disk_hits, cache.misses) == (1, 0, 0)
+
+    assert cache.get(("sql", 0, "b")) == "B"
+    assert cache.get(("sql", 1, "b")) is None
+    assert (cache.hits, cache.disk_hits, cache.misses) == (2, 1, 1)
+
+
+class YieldingDict(OrderedDict[CodeKey, str]):
+    def move_to_end(self, key: CodeKey, last: bool = True) -> None:
+        time.sleep(0)  # let other threads run to expose races
+        super().move_to_end(key, last)
+
+
+def test_code_cache_threads() -> None:
+    cache = CodeCache(maxsize=8)
+    cache._entries = YieldingDict()
+
+    def work(i: int) -> None:
+        for j in range(1000):
+            key = ("sql", 0, str((i + j) % 16))
+            if cache.get(key) is None:
+                cache.set(key, "")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(8)))  # raise if any
+    assert len(cache) == 8
+    assert cache.hits + cache.misses == 8 * 1000
+
+
+def test_code_cache_formatter() -> None:
+    code_cache.clear()
+    lkml = "dimension: d { sql: ${TABLE}.col ;; } measure: m { sql: ${TABLE}.col ;; }"
+    fmt(lkml)
+    assert (code_cache.hits, code_cache.misses) == (1, 1)
+
+    # indent is a part of the key
+    fmt(f"view: v {{ {lkml} }}")
+    assert (code_cache.hits, code_cache.misses) == (2, 2)
@@ -0,0 +1,352 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from lkmlfmt import command
+from lkmlfmt.cache import CACHE_DIR, code_cache
+from lkmlfmt.command import main, run
+from lkmlfmt.watch import Watcher
+
+FORMATTED = "key: value\n"
+UNFORMATTED = "key:   value"
+
+
+@pytest.fixture(autouse=True)
+def chdir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # the cache is created in the current directory
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def lkml_dir(tmp_path: Path) -> Path:
+    tmp_path = tmp_path / "lkml"
+    tmp_path.mkdir()
+    for i in range(8):
+        text = UNFORMATTED if i % 2 == 0 else FORMATTED
+        (tmp_path / f"file{i}.view.lkml").write_text(text)
+    (tmp_path / "README.md").write_text("not lookml")
+    return tmp_path
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_run(lkml_dir: Path, jobs: str) -> None:
+    files = [str(lkml_dir / f"file{i}.view.lkml") for i in range(8)]
+    result = CliRunner().invoke(run, ["--jobs", jobs, *files])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        f"{f} is {'modified' if i % 2 == 0 else 'skipped'}" for i, f in enumerate(files)
+    ] + ["4 files are modified, 4 files are skipped."]
+
+    for i in range(8):
+        assert (lkml_dir / f"file{i}.view.lkml").read_text() == FORMATTED
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_run_check(lkml_dir: Path, jobs: str) -> None:
+    result = CliRunner().invoke(run, ["--check", "--jobs", jobs, str(lkml_dir)])
+    assert result.exit_code == 1
+    assert "4 files are modified, 4 files are skipped." in result.output
+    assert result.output.count("+key: value") == 4
+
+    for i in range(8):
+        text = UNFORMATTED if i % 2 == 0 else FORMATTED
+        assert (lkml_dir / f"file{i}.view.lkml").read_text() == text
+
+
+def test_run_cache(lkml_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    result = CliRunner().invoke(run, ["--jobs", "1", str(lkml_dir)])
+    assert result.exit_code == 0
+    assert (CACHE_DIR / ".gitignore").exists()
+    assert code_cache.disk is None  # restored for later calls in the process
+
+    def fail(*args: object) -> str:
+        raise AssertionError("formatted files should not be parsed")
+
+    monkeypatch.setattr(command, "LkmlFormatter", fail)
+    result = CliRunner().invoke(run, ["--jobs", "1", str(lkml_dir)])
+    assert result.exit_code == 0
+    assert "0 files are modified, 8 files are skipped." in result.output
+
+    # configuration is a part of the key
+    result = CliRunner().invoke(run, ["--jobs", "1", "--clickhouse", str(lkml_dir)])
+    assert isinstance(result.exception, AssertionError)
+
+    result = CliRunner().invoke(run, ["--jobs", "1", "--no-cache", str(lkml_dir)])
+    assert isinstance(result.exception, AssertionError)
+
+    # even if the files are cached
+    args = ["--jobs", "1", "--plugin", "unknown.plugin", str(lkml_dir)]
+    result = CliRunner().invoke(run, args)
+    assert result.exit_code == 2
+    assert "unknown.plugin is not found" in result.output
+
+
+def git(*args: str) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=lkmlfmt", "-c", "user.email=lkmlfmt@example.com"]
+        + list(args),
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_run_changed_since(tmp_path: Path) -> None:
+    git("init", "--quiet")
+    for name in ["committed", "modified", "untracked"]:
+        Path(f"{name}.view.lkml").write_text(UNFORMATTED)
+    git("add", "committed.view.lkml", "modified.view.lkml")
+    git("commit", "--quiet", "--message", "initial commit")
+    Path("modified.view.lkml").write_text(UNFORMATTED + "\n")
+
+    result = CliRunner().invoke(run, ["--jobs", "1", "--changed-since", "HEAD", "."])
+    assert result.exit_code == 0
+    assert "2 files are modified, 0 files are skipped." in result.output
+    assert Path("committed.view.lkml").read_text() == UNFORMATTED
+    assert Path("modified.view.lkml").read_text() == FORMATTED
+    assert Path("untracked.view.lkml").read_text() == FORMATTED
+
+    result = CliRunner().invoke(run, ["--changed-since", "unknown", "."])
+    assert result.exit_code == 1
+    assert "unknown" in result.output
+
+
+def test_run_changed_since_outside(tmp_path: Path) -> None:
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    git("-C", str(repo), "init", "--quiet")
+    (repo / "committed.view.lkml").write_text(UNFORMATTED)
+    git("-C", str(repo), "add", "committed.view.lkml")
+    git("-C", str(repo), "commit", "--quiet", "--message", "initial commit")
+    (repo / "untracked.view.lkml").write_text(UNFORMATTED)
+
+    # the current directory is not a git repository
+    result = CliRunner().invoke(run, ["--changed-since", "HEAD", "repo"])
+    assert result.exit_code == 0
+    assert "1 files are modified, 0 files are skipped." in result.output
+    assert (repo / "committed.view.lkml").read_text() == UNFORMATTED
+    assert (repo / "untracked.view.lkml").read_text() == FORMATTED
+
+    result = CliRunner().invoke(
+        run, ["--changed-since", "HEAD", "repo/committed.view.lkml"]
+    )
+    assert result.exit_code == 0
+    assert "0 files are modified, 0 files are skipped." in result.output
+
+
+def test_run_lines(tmp_path: Path) -> None:
+    file = tmp_path / "file.view.lkml"
+    file.write_text("a:   b\nc:   d\ne:   f\n")
+
+    result = CliRunner().invoke(run, ["--lines", "1:1", "--lines", "3:5", str(file)])
+    assert result.exit_code == 0
+    assert file.read_text() == "a: b\nc:   d\ne: f\n"
+    assert not (CACHE_DIR / "files").exists()
+
+    result = CliRunner().invoke(run, ["--lines", "2", str(file)])
+    assert result.exit_code == 2
+    assert "2 is not START:END" in result.output
+
+
+@pytest.mark.parametrize("args", [[], ["format"]])
+def test_main(lkml_dir: Path, args: list[str]) -> None:
+    result = CliRunner().invoke(main, [*args, "--jobs", "1", str(lkml_dir)])
+    assert result.exit_code == 0
+    assert "4 files are modified, 4 files are skipped." in result.output
+
+
+def test_run_watch(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    file = tmp_path / "file.view.lkml"
+    file.write_text(UNFORMATTED)
+
+    def batches(self: Watcher) -> Iterator[list[Path]]:
+        file.write_text(UNFORMATTED)
+        yield [file]
+        assert file.read_text() == FORMATTED
+        file.write_text("key: {")  # being edited
+        yield [file]
+
+    monkeypatch.setattr(Watcher, "batches", batches)
+    result = CliRunner().invoke(run, ["--watch", str(file)])
+    assert result.exit_code == 0
+    assert result.output.count(f"{file} is modified") == 2
+    assert f"{file} is not formatted" in result.output
+    assert file.read_text() == "key: {"
+
+    result = CliRunner().invoke(run, ["--watch", "--check", str(file)])
+    assert result.exit_code == 2
+
+
+def test_run_stdin(tmp_path: Path) -> None:
+    result = CliRunner().invoke(run, ["-"], input=UNFORMATTED)
+    assert result.exit_code == 0
+    assert result.output == FORMATTED
+
+    result = CliRunner().invoke(run, ["--check", "-"], input=UNFORMATTED)
+    assert result.exit_code == 1
+    assert "+key: value" in result.output
+
+    result = CliRunner().invoke(run, ["-", str(tmp_path)], input=UNFORMATTED)
+    assert result.exit_code == 2
+
+    result = CliRunner().invoke(run, ["-"], input="view: {")
+    assert result.exit_code == 1
+    assert result.output.startswith("Error: <stdin>: ")
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_run_stdin_ndjson(jobs: str) -> None:
+    records = [{"path": f"file{i}.view.lkml", "content": UNFORMATTED} for i in range(8)]
+    records.append({"path": "error.view.lkml", "content": "key: {"})
+    lines = [json.dumps(r) for r in records] + ["", "not json"]
+
+    args = ["--stdin-ndjson", "--jobs", jobs]
+    result = CliRunner().invoke(run, args, input="\n".join(lines))
+    assert result.exit_code == 0
+
+    # records are written in the order they are completed
+    outputs = {}
+    for line in result.output.splitlines():
+        output = json.loads(line)
+        outputs[output.pop("path")] = output
+    assert len(outputs) == 10
+    for r in records[:8]:
+        assert outputs[r["path"]] == {"content": FORMATTED}
+    assert "UnexpectedToken" in outputs["error.view.lkml"]["error"]
+    assert "JSONDecodeError" in outputs[None]["error"]
+
+
+def test_run_stdin_ndjson_streaming() -> None:
+    args = ["--no-cache", "--stdin-ndjson", "--jobs", "2"]
+    with subprocess.Popen(
+        [sys.executable, "-m", "lkmlfmt", *args],
+        cwd=Path(__file__).parents[1],  # lkmlfmt may not be installed
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    ) as proc:
+        assert proc.stdin is not None and proc.stdout is not None
+        for i in range(2):
+            record = {"path": f"file{i}", "content": UNFORMATTED}
+            proc.stdin.write(json.dumps(record) + "\n")
+            proc.stdin.flush()
+            # the result is written before stdin is closed
+            assert json.loads(proc.stdout.readline())["path"] == f"file{i}"
+        proc.stdin.close()
+        assert proc.wait() == 0
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_run_stats_json(tmp_path: Path, jobs: str) -> None:
+    for i in range(4):
+        (tmp_path / f"file{i}.view.lkml").write_text(f"sql: select {i} ;;")
+    report = tmp_path / "stats.json"
+    code_cache.clear()  # workers may inherit it
+
+    args = ["--no-cache", "--jobs", jobs, "--stats-json", str(report), str(tmp_path)]
+    result = CliRunner().invoke(run, args)
+    assert result.exit_code == 0
+
+    stats = json.loads(report.read_text())
+    # collected in worker processes
+    assert stats["phases"]["parse"]["calls"] == 4
+    assert stats["phases"]["sqlfmt"]["calls"] == 4
+    assert len(stats["files"]) == 4
+    assert {(b["key"], b["line"]) for b in stats["slowest_blocks"]} == {("sql", 1)}
+
+    # a large file is not formatted in the block pool
+    file = tmp_path / "large.view.lkml"
+    file.write_text("".join(f"sql: select {i} ;;\n" for i in range(80)))
+    code_cache.clear()
+    args = ["--no-cache", "--jobs", jobs, "--stats-json", str(report), str(file)]
+    result = CliRunner().invoke(run, args)
+    assert result.exit_code == 0
+    stats = json.loads(report.read_text())
+    assert stats["phases"]["sqlfmt"]["calls"] == 80
+
+    for args in [["-"], ["--stdin-ndjson"]]:
+        result = CliRunner().invoke(run, ["--stats-json", str(report), *args])
+        assert result.exit_code == 2
+
+
+def test_run_profile(tmp_path: Path) -> None:
+    file = tmp_path / "file.view.lkml"
+    file.write_text(UNFORMATTED)
+    profile = tmp_path / "lkmlfmt.prof"
+
+    result = CliRunner().invoke(run, ["--profile", str(profile), str(file)])
+    assert result.exit_code == 0
+    assert 0 < pstats.Stats(str(profile)).total_calls  # type: ignore
+
+
+def test_run_block_timeout(tmp_path: Path) -> None:
+    file = tmp_path / "file.view.lkml"
+    file.write_text("sql: select sleep(10) ;;\nsql: select 1 ;;")
+
+    args = ["--plugin", "tests.slow_plugin", "--block-timeout", "0.2", str(file)]
+    result = CliRunner().invoke(run, args)
+    assert result.exit_code == 0
+    assert file.read_text() == "sql: select sleep(10) ;;\nsql: SELECT 1 ;;\n"
+    assert (CACHE_DIR / "slow").exists()  # remembered not to be formatted again
+
+
+def test_run_block_timeout_cold(tmp_path: Path) -> None:
+    # importing sqlfmt in a new process is not charged to the first block
+    file = tmp_path / "file.view.lkml"
+    file.write_text("sql: select a,b,c from t where x=1 ;;")
+
+    root = Path(__file__).parents[1]  # lkmlfmt may not be installed
+    subprocess.run(
+        [sys.executable, "-m", "lkmlfmt", "--block-timeout", "0.05", str(file)],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": str(root)},
+        check=True,
+        capture_output=True,
+    )
+    assert file.read_text() == "sql: select a, b, c from t where x = 1 ;;\n"
+    assert not (CACHE_DIR / "slow").exists()
+
+
+def test_run_large_file(tmp_path: Path) -> None:
+    # code blocks of a single large file are formatted by workers
+    file = tmp_path / "file.view.lkml"
+    file.write_text(" ".join(f"sql: select {i}   from t ;;" for i in range(80)))
+    expected = "".join(f"sql: select {i} from t ;;\n" for i in range(80))
+
+    code_cache.clear()
+    result = CliRunner().invoke(run, ["--no-cache", "--jobs", "2", str(file)])
+    assert result.exit_code == 0
+    assert file.read_text() == expected
+    assert code_cache.misses == 0
+
+
+def test_run_file_timeout_cache(tmp_path: Path) -> None:
+    file = tmp_path / "file.view.lkml"
+    file.write_text("sql: select sleep(0.3) ;;\nsql: select sleep(0.3), 1 ;;")
+
+    args = ["--plugin", "tests.slow_plugin", "--file-timeout", "0.5", str(file)]
+    assert CliRunner().invoke(run, args).exit_code == 0
+    assert file.read_text() == (
+        "sql: SELECT SLEEP(0.3) ;;\nsql: select sleep(0.3), 1 ;;\n"
+    )
+
+    # the file is not cached as formatted, so it is tried again.
+    # this time, the first block does not sleep because it is uppercased
+    assert CliRunner().invoke(run, args).exit_code == 0
+    assert file.read_text() == (
+        "sql: SELECT SLEEP(0.3) ;;\nsql: SELECT SLEEP(0.3), 1 ;;\n"
+    )
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_run_syntax_error(lkml_dir: Path, jobs: str) -> None:
+    (lkml_dir / "invalid.view.lkml").write_text("key: {")
+    result = CliRunner().invoke(run, ["--no-cache", "--jobs", jobs, str(lkml_dir)])
+    assert result.exit_code == 1
+    assert f"{lkml_dir / 'invalid.view.lkml'}: Unexpected token" in result.output
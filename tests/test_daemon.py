@@ -0,0 +1,94 @@
+import os
+import stat
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from click.testing import CliRunner
+
+from lkmlfmt import daemon
+from lkmlfmt.command import main
+from lkmlfmt.exception import LkmlfmtException
+
+FORMATTED = "key: value\n"
+UNFORMATTED = "key:   value"
+
+
+@pytest.fixture
+def socket_path(tmp_path: Path) -> Iterator[Path]:
+    path = tmp_path / "lkmlfmt.sock"
+    server = daemon.make_server(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_client(socket_path: Path) -> None:
+    client = daemon.connect(socket_path)
+    assert client is not None
+    try:
+        # a connection can be reused
+        assert client.fmt(UNFORMATTED) == FORMATTED
+        assert client.fmt("a:   b\nc:   d\n", ranges=[(2, 2)]) == "a:   b\nc: d\n"
+
+        with pytest.raises(LkmlfmtException, match="UnexpectedToken"):
+            client.fmt("key: {")
+        assert client.fmt(UNFORMATTED) == FORMATTED
+    finally:
+        client.close()
+
+
+def test_make_server_running(socket_path: Path) -> None:
+    with pytest.raises(LkmlfmtException, match="already running"):
+        daemon.make_server(socket_path)
+
+
+def test_make_server_stale(tmp_path: Path) -> None:
+    path = tmp_path / "lkmlfmt.sock"
+    path.touch()
+    assert daemon.connect(path) is None
+    with daemon.make_server(path):
+        assert daemon.connect(path) is not None
+    assert not path.exists()
+
+
+def test_socket_private(socket_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    assert stat.S_IMODE(socket_path.stat().st_mode) == 0o600
+
+    # sockets of other users are not trusted
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+    assert daemon.connect(socket_path) is None
+    monkeypatch.undo()
+
+    socket_path.chmod(0o666)
+    assert daemon.connect(socket_path) is None
+
+
+def test_default_socket(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    path = daemon.default_socket()
+    with daemon.make_server(path):
+        assert stat.S_IMODE(path.parent.stat().st_mode) == 0o700
+        client = daemon.connect(path)
+        assert client is not None
+        client.close()
+
+
+@pytest.mark.parametrize("running", [True, False])
+def test_run_use_daemon(tmp_path: Path, socket_path: Path, running: bool) -> None:
+    file = tmp_path / "file.view.lkml"
+    file.write_text(UNFORMATTED)
+    socket = socket_path if running else tmp_path / "unknown.sock"
+
+    args = ["--no-cache", "--use-daemon", "--socket", str(socket), str(file)]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0
+    assert "1 files are modified, 0 files are skipped." in result.output
+    assert file.read_text() == FORMATTED
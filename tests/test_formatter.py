@@ -1,6 +1,11 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pytest
+from sqlfmt import api
 
-from lkmlfmt.formatter import fmt
+from lkmlfmt.cache import code_cache
+from lkmlfmt.exception import LkmlfmtException
+from lkmlfmt.formatter import LkmlFormatter, fmt, fmt_many, fmt_range
 from tests import utils
 
 
@@ -542,3 +547,152 @@ def test_formatter_clickhouse(input_: str, output: str) -> None:
     # twice formatted text also matches expected output
     text2 = fmt(text1, clickhouse=True, plugins=[])
     assert text2 == output
+
+
+def test_formatter_threads() -> None:
+    inputs = []
+    for i in range(40):
+        sql = f"select {', '.join(f'column_{i}_{j}' for j in range(8))} from t{i}"
+        inputs.append("dict: { " * (i % 4) + f"sql: {sql} ;;" + " }" * (i % 4))
+
+    expected = [fmt(i) for i in inputs]
+    code_cache.clear()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(fmt, inputs)) == expected
+
+
+def test_formatter_deep() -> None:
+    # deeper than the recursion limit
+    depth = 500
+    lkml = "k: {" * depth + "v: 1" + "}" * depth
+    expected = "".join("  " * i + "k: {\n" for i in range(depth))
+    expected += "  " * depth + "v: 1\n"
+    expected += "".join("  " * i + "}\n" for i in reversed(range(depth)))
+    assert fmt(lkml) == expected
+
+
+def test_formatter_prefill() -> None:
+    lkml = """\
+view: v {
+  sql_table_name: t ;;
+  derived_table: { sql: select a, b from t where c = 1 ;; }
+  dimension: d {
+    sql: case when ${TABLE}.a > 0 then ${TABLE}.b else 0 end ;;
+    html: <p>{{ value }}</p> ;;
+    filters: [x: "1", y: { sql: select 1 ;; }]
+  }
+  measure: m { sql: ${d} ;; }
+}
+explore: e { expression: not ${v.d} or ${v.d} = "a" ;; sql_always_where: 1 = 1 ;; }
+sql: select a, b from t where c = 1 ;;
+"""
+    expected = fmt(lkml)
+    code_cache.clear()
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        formatter = LkmlFormatter(lkml, clickhouse=False, plugins=[])
+        formatter.prefill(executor)
+        assert len(formatter.formatted) == 9
+        assert formatter.fmt() == expected
+        assert code_cache.misses == 0  # nothing is formatted in this process
+        assert fmt(lkml, executor=executor) == expected
+
+
+def test_formatter_unknown_plugin() -> None:
+    # even if no code block needs it
+    with pytest.raises(ModuleNotFoundError):
+        fmt("key: value", plugins=["unknown_plugin"])
+
+
+def test_formatter_sqlfmt_intact() -> None:
+    sql = "select\n" + ",\n".join(f"c{i}" for i in range(40))
+    fmt(f"dict: {{ sql: {sql} ;; }}")
+    # sqlfmt itself still indents with 4 spaces
+    assert api.format_string(sql, api.Mode()).startswith("select\n    c0,\n")
+
+
+RANGE_INPUT = """\
+# comment   
+view:   a {
+  dimension: x { sql: ${TABLE}.x ;; }
+}   # trailing comment
+  # leading comment
+view: b { dimension: y {
+   sql:   ${TABLE}.y ;; }
+  values: [ ]
+  # inner comment
+}
+k1: v1  k2:  v2
+"""  # noqa: W291
+
+
+@pytest.mark.parametrize(
+    "ranges, output",
+    [
+        ([], RANGE_INPUT),
+        ([(1, 1)], RANGE_INPUT),
+        (
+            [(3, 3)],
+            """\
+# comment   
+view: a {
+  dimension: x {
+    sql: ${TABLE}.x ;;
+  }
+}
+# trailing comment
+  # leading comment
+view: b { dimension: y {
+   sql:   ${TABLE}.y ;; }
+  values: [ ]
+  # inner comment
+}
+k1: v1  k2:  v2
+""",  # noqa: W291
+        ),
+        (
+            [(10, 11)],
+            """\
+# comment   
+view:   a {
+  dimension: x { sql: ${TABLE}.x ;; }
+}   # trailing comment
+  # leading comment
+view: b {
+  dimension: y {
+    sql: ${TABLE}.y ;;
+  }
+  values: []
+}
+# inner comment
+k1: v1
+k2: v2
+""",  # noqa: W291
+        ),
+    ],
+    ids=utils.shorten,
+)
+def test_fmt_range(ranges: list[tuple[int, int]], output: str) -> None:
+    assert fmt_range(RANGE_INPUT, ranges) == output
+
+
+def test_fmt_range_whole() -> None:
+    lkml = "view: a {x: [a,\nb]}\n\n\nview: b {}  # comment\nkey: value"
+    assert fmt_range(lkml, [(1, 6)]) == fmt(lkml)
+
+
+@pytest.mark.parametrize("executor", [None, "thread", "process"])
+def test_fmt_many(executor: str | None) -> None:
+    inputs = [f"sql: select {i}, {i % 7} from t ;;" for i in range(200)]
+    expected = [fmt(i) for i in inputs]
+
+    if executor is None:
+        assert list(fmt_many(iter(inputs))) == expected
+        return
+
+    cls = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+    with cls(max_workers=2) as ex:
+        assert list(fmt_many(iter(inputs), executor=ex, chunksize=3)) == expected
+
+        with pytest.raises(LkmlfmtException, match="Unexpected token"):
+            list(fmt_many(["key: value", "key: {"], executor=ex))
@@ -0,0 +1,193 @@
+import io
+import json
+import subprocess
+import sys
+from typing import Any
+
+import pytest
+
+from lkmlfmt import lsp
+from lkmlfmt.cache import code_cache
+
+URI = "file:///project/orders.view.lkml"
+UNFORMATTED = "a:   b\nc:   d\n"
+
+
+def message(method: str, params: Any = None, id: int | None = None) -> bytes:
+    msg = {"jsonrpc": "2.0", "method": method, "params": params}
+    if id is not None:
+        msg["id"] = id
+    body = json.dumps(msg).encode()
+    return f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+def parse(output: bytes) -> list[Any]:
+    rfile = io.BytesIO(output)
+    server = lsp.Server(rfile, io.BytesIO())
+    messages = []
+    while (msg := server.read()) is not None:
+        messages.append(msg)
+    return messages
+
+
+def talk(*messages: bytes) -> tuple[int, dict[int, Any]]:
+    wfile = io.BytesIO()
+    server = lsp.Server(io.BytesIO(b"".join(messages)), wfile)
+    code = server.serve()
+    return code, {res["id"]: res for res in parse(wfile.getvalue())}
+
+
+def open_(text: str, uri: str = URI) -> bytes:
+    doc = {"uri": uri, "languageId": "lookml", "version": 1, "text": text}
+    return message("textDocument/didOpen", {"textDocument": doc})
+
+
+def change(text: str, uri: str = URI) -> bytes:
+    doc = {"uri": uri, "version": 2}
+    params = {"textDocument": doc, "contentChanges": [{"text": text}]}
+    return message("textDocument/didChange", params)
+
+
+def formatting(id: int, uri: str = URI) -> bytes:
+    params = {"textDocument": {"uri": uri}, "options": {}}
+    return message("textDocument/formatting", params, id)
+
+
+def range_formatting(id: int, start: int, end: int, character: int = 0) -> bytes:
+    range_ = {
+        "start": {"line": start, "character": 0},
+        "end": {"line": end, "character": character},
+    }
+    params = {"textDocument": {"uri": URI}, "range": range_, "options": {}}
+    return message("textDocument/rangeFormatting", params, id)
+
+
+def test_lifecycle() -> None:
+    code, res = talk(
+        message("initialize", {"capabilities": {}}, 1),
+        message("initialized", {}),
+        message("shutdown", None, 2),
+        formatting(3),
+        message("exit"),
+    )
+    assert code == 0
+    assert res[1]["result"]["capabilities"]["documentFormattingProvider"]
+    assert res[2]["result"] is None
+    assert res[3]["error"]["code"] == lsp.INVALID_REQUEST
+
+    code, res = talk(message("unknown", {}, 1), message("exit"))
+    assert code == 1  # exit without shutdown
+    assert res[1]["error"]["code"] == lsp.METHOD_NOT_FOUND
+
+
+def test_formatting() -> None:
+    _, res = talk(
+        open_('key:   "𝄞"'),
+        formatting(1),
+        change('key: "𝄞"\n'),
+        formatting(2),
+        change("key: {"),
+        formatting(3),
+        formatting(4, "file:///unknown.view.lkml"),
+        open_(UNFORMATTED, "file:///README.md"),
+        formatting(5, "file:///README.md"),
+    )
+    assert res[1]["result"] == [
+        {
+            "range": {
+                "start": {"line": 0, "character": 0},
+                # a surrogate pair is counted as 2 characters
+                "end": {"line": 0, "character": 11},
+            },
+            "newText": 'key: "𝄞"\n',
+        }
+    ]
+    assert res[2]["result"] == []
+    assert res[3]["error"]["code"] == lsp.REQUEST_FAILED
+    assert res[4]["result"] is None
+    assert res[5]["result"] is None
+
+
+def test_invalid_params() -> None:
+    code, res = talk(
+        change("a: b", "file:///unknown.view.lkml"),
+        message("textDocument/didOpen", {"textDocument": {}}),
+        message("textDocument/rangeFormatting", {"textDocument": {"uri": URI}}, 1),
+        message("textDocument/formatting", {"textDocument": None}, 2),
+        open_(UNFORMATTED),
+        formatting(3),
+        message("shutdown", None, 4),
+        message("exit"),
+    )
+    assert code == 0
+    assert res[1]["error"]["code"] == lsp.INVALID_PARAMS
+    assert res[2]["error"]["code"] == lsp.INVALID_PARAMS
+    assert res[3]["result"][0]["newText"] == "a: b\nc: d\n"
+
+
+@pytest.mark.parametrize(
+    "raw,code",
+    [
+        (b"Content-Length: 9\r\n\r\n{not json", lsp.PARSE_ERROR),
+        (b"Content-Length: 2\r\n\r\n\xff\xfe", lsp.PARSE_ERROR),
+        (b"Content-Length: x\r\n\r\n", lsp.PARSE_ERROR),
+        (b"Content-L\xc3\xa9ngth: 2\r\n\r\n", lsp.PARSE_ERROR),
+        (b"Content-Length: 5\r\n\r\n[1,2]", lsp.INVALID_REQUEST),
+    ],
+)
+def test_invalid_message(raw: bytes, code: int) -> None:
+    wfile = io.BytesIO()
+    server = lsp.Server(
+        io.BytesIO(raw + message("shutdown", None, 1) + message("exit")), wfile
+    )
+    assert server.serve() == 0
+    error, response = parse(wfile.getvalue())
+    assert error["id"] is None
+    assert error["error"]["code"] == code
+    assert response == {"jsonrpc": "2.0", "id": 1, "result": None}
+
+
+@pytest.mark.parametrize(
+    "start,end,character,expected",
+    [
+        (0, 1, 0, "a: b\nc:   d\n"),
+        (1, 1, 3, "a:   b\nc: d\n"),
+        (0, 2, 0, "a: b\nc: d\n"),
+    ],
+)
+def test_range_formatting(start: int, end: int, character: int, expected: str) -> None:
+    _, res = talk(open_(UNFORMATTED), range_formatting(1, start, end, character))
+    assert res[1]["result"][0]["newText"] == expected
+
+
+def test_document() -> None:
+    doc = lsp.Document("sql: select 1 ;;")
+    assert doc.fmt(False, []) == "sql: select 1 ;;\n"
+
+    hits, misses = code_cache.hits, code_cache.misses
+    doc.update("sql: select 1 ;;")
+    doc.fmt(False, [])
+    assert (code_cache.hits, code_cache.misses) == (hits, misses)  # not even parsed
+
+    doc.update("sql: select 1 ;;\n")
+    doc.fmt(False, [])
+    assert code_cache.misses == misses  # the code block is not changed
+
+
+def test_subprocess() -> None:
+    proc = subprocess.run(
+        [sys.executable, "-m", "lkmlfmt", "lsp"],
+        input=b"".join(
+            [
+                message("initialize", {"capabilities": {}}, 1),
+                open_(UNFORMATTED),
+                formatting(2),
+                message("shutdown", None, 3),
+                message("exit"),
+            ]
+        ),
+        capture_output=True,
+        check=True,
+    )
+    res = {msg["id"]: msg for msg in parse(proc.stdout)}
+    assert res[2]["result"][0]["newText"] == "a: b\nc: d\n"
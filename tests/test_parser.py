@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
 import pytest
 
-from lkmlfmt.parser import lkml_parser
+from lkmlfmt.parser import NO_SPAN, Span, SpanTree, lkml_parser, parse
 from tests import utils
 
 
@@ -266,3 +269,52 @@ string
 def test_parser(input_: str, output: str) -> None:
     tree = lkml_parser.parse(input_)
     assert tree.pretty(indent_str=" " * 4) == output
+
+
+def test_parse_comments() -> None:
+    tree, comments = parse("# comment 1\nkey: value # comment 2\n")
+    assert [c.value for c in comments] == ["# comment 1", "# comment 2"]
+
+    # comments are not shared between calls
+    _, comments2 = parse("key: value")
+    assert comments2 == []
+    assert len(comments) == 2
+
+
+def test_parse_span() -> None:
+    tree, _ = parse("""\
+view: v {
+  dimension: d {
+    sql: ${TABLE}.d
+    ;;
+  }
+  set: s { fields: [] }
+  empty: {}
+}
+""")
+    assert isinstance(tree, SpanTree)
+    # closing brackets are not included
+    assert tree.span == Span(1, 1, 7, 8)
+
+    root: Any = tree
+    dict_ = root.children[0].children[1].children[1]
+    dimension, set_, empty = dict_.children
+    assert dimension.span == Span(2, 3, 4, 7)
+    assert dimension.children[1].children[1].children[0].span == Span(3, 5, 4, 7)
+    assert set_.span == Span(6, 3, 6, 18)
+    assert set_.children[1].children[1].children[0].children[1].span == NO_SPAN
+    assert empty.children[1].span == NO_SPAN
+
+
+def test_parse_threads() -> None:
+    inputs = [
+        "".join(f"key{j}: value # comment {i}.{j}\n" for j in range(i % 7))
+        for i in range(200)
+    ]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(parse, inputs))
+
+    for i, (_, comments) in enumerate(results):
+        assert [c.value for c in comments] == [
+            f"# comment {i}.{j}" for j in range(i % 7)
+        ]
@@ -0,0 +1,62 @@
+import pickle
+
+from lkmlfmt import stats
+from lkmlfmt.cache import code_cache
+from lkmlfmt.formatter import fmt
+from lkmlfmt.stats import Stats
+
+LKML = """\
+view: v {
+  derived_table: {
+    sql: select 1 ;;
+  }
+  dimension: d {
+    sql: ${TABLE}.d ;;
+    html: <b>{{ value }}</b> ;;
+  }
+}
+"""
+
+
+def test_disabled() -> None:
+    assert stats.phase("parse") is stats.block("sql", 1) is stats.file("a")
+    fmt(LKML)  # nothing is recorded anywhere
+
+
+def test_collect() -> None:
+    s = Stats(max_blocks=2)
+    code_cache.clear()
+    with stats.collect(s), stats.file("a.view.lkml"):
+        fmt(LKML)
+
+    report = s.report()
+    for phase in ["parse", "to_jinja", "sqlfmt", "to_liquid"]:
+        assert 0 < report["phases"][phase]["calls"]
+    assert report["phases"]["parse"]["calls"] == 1
+    assert [f["path"] for f in report["files"]] == ["a.view.lkml"]
+
+    blocks = report["slowest_blocks"]
+    assert len(blocks) == 2
+    assert blocks[0]["seconds"] >= blocks[1]["seconds"]
+    assert {b["path"] for b in blocks} == {"a.view.lkml"}
+    assert {(b["key"], b["line"]) for b in blocks} <= {
+        ("sql", 3),
+        ("sql", 6),
+        ("html", 7),
+    }
+
+
+def test_merge() -> None:
+    a, b = Stats(max_blocks=2), Stats(max_blocks=2)
+    with a.file("a"), a.phase("parse"), a.block("sql", 1):
+        pass
+    with b.file("b"), b.phase("parse"), b.phase("sqlfmt"):
+        with b.block("sql", 2), b.block("html", 3):
+            pass
+
+    a.merge(pickle.loads(pickle.dumps(b)))
+    report = a.report()
+    assert report["phases"]["parse"]["calls"] == 2
+    assert report["phases"]["sqlfmt"]["calls"] == 1
+    assert {f["path"] for f in report["files"]} == {"a", "b"}
+    assert len(report["slowest_blocks"]) == 2
@@ -1,8 +1,9 @@
+import random
 import re
 
 import pytest
 
-from lkmlfmt.template import to_jinja, to_liquid
+from lkmlfmt.template import LIQUID_MARKER, MARKER, to_jinja, to_liquid
 from tests import utils
 
 
@@ -160,3 +161,48 @@ def test_to_liquid(
 ) -> None:
     res = to_liquid(jinja, templates, dummies)
     assert res == liquid
+
+
+# the original quadratic implementation
+def to_liquid_reference(jinja: str, templates: list[str], dummies: list[str]) -> str:
+    for i in range(len(templates)):
+        leading, trailing, *_ = jinja.split(LIQUID_MARKER.format(i))
+        space, *_ = trailing.split(dummies[i])
+        if "\n" in space:
+            leading = leading.rstrip("\n ")
+        else:
+            trailing = trailing.lstrip(" ")
+
+        trailing = trailing.replace(dummies[i], templates[i], 1)
+        jinja = leading + trailing
+
+    return jinja
+
+
+ATOMS = [
+    *["{% if x %}", "{% elsif y %}", "{% endif %}", "{% for i in x %}"],
+    *["{% raw %}", "{% endraw %}", "{% comment %}", "{% endcomment %}"],
+    *["{{ a }}", "{{ 'b' }}", "${x.y}", "@{z}", "{% date_start x %}", "{% # c %}"],
+    *["select", "col", "1", ",", "(", ")", "'", "{", "}", "%"],
+    *[" ", "  ", "\n", "\n  "],
+]
+SPACES = ["", " ", "  ", "\n", "\n  ", " \n    "]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_to_liquid_property(seed: int) -> None:
+    rand = random.Random(seed)
+    for _ in range(100):
+        liquid = "".join(rand.choices(ATOMS, k=rand.randint(0, 40)))
+        jinja, templates, dummies = to_jinja(liquid)
+
+        # round trip
+        assert to_liquid(jinja, templates, dummies) == liquid
+
+        # sqlfmt may move markers and dummies to other lines
+        jinja = MARKER.sub(
+            lambda m: rand.choice(SPACES) + m.group(0) + rand.choice(SPACES), jinja
+        )
+        assert to_liquid(jinja, templates, dummies) == to_liquid_reference(
+            jinja, templates, dummies
+        )
@@ -0,0 +1,52 @@
+import os
+from pathlib import Path
+
+from lkmlfmt.command import filter_lkml
+from lkmlfmt.watch import Watcher
+
+
+def touch(path: Path, text: str | None = None) -> None:
+    if text is not None:
+        path.write_text(text)
+    # mtime may not change if the file is modified too quickly
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_watcher(tmp_path: Path) -> None:
+    a, b = tmp_path / "a.view.lkml", tmp_path / "b.view.lkml"
+    a.write_text("a: 1")
+    b.write_text("b: 1")
+    (tmp_path / "README.md").write_text("not lookml")
+    watcher = Watcher(lambda: filter_lkml([tmp_path]), debounce=1)
+    assert watcher.step(0) == []
+
+    # a burst of changes is reported at once after the debounce
+    touch(a, "a: 2")
+    assert watcher.step(1) == []
+    touch(b, "b: 2")
+    c = tmp_path / "c.view.lkml"
+    c.write_text("c: 1")
+    assert watcher.step(1.5) == []
+    assert watcher.step(2) == []
+    assert watcher.step(2.5) == [a, b, c]
+    assert watcher.step(5) == []
+
+    # the contents are not changed
+    touch(a)
+    touch(tmp_path / "README.md", "not lookml")
+    assert watcher.step(6) == []
+    assert watcher.step(7) == []
+
+    # formatted by lkmlfmt itself
+    touch(a, "a: 3")
+    watcher.record(a)
+    assert watcher.step(8) == []
+    assert watcher.step(9) == []
+
+    # removed before reported
+    touch(b, "b: 3")
+    assert watcher.step(10) == []
+    b.unlink()
+    assert watcher.step(11) == []
+    assert watcher.step(12) == []